@@ -5,13 +5,101 @@ from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_absolute_error
 import time
 import datetime
+import pickle
+import copy
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import warnings
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
 
-from pybaseball import playerid_reverse_lookup
 import category_encoders as ce
 
+from database_utility import PlayerCrosswalk, KeyService, HandednessIndex, SURROGATE_KEY_COLS
+
+#optional - limits the BLAS/OpenMP threads of fold workers that are already running
+try:
+	from threadpoolctl import threadpool_limits
+except ImportError:
+	threadpool_limits = None
+
+#thread count variables of the OpenMP/BLAS builds numpy and the boosting libraries use
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+class DaySplit(object):
+	'''
+	Walk-forward splits on whole game days, for rows sorted by date.  Split k trains on every day before its test days
+	and tests on the next test_days days, so a slate is never cut in two - the same as predicting tomorrow's slate with
+	everything up to today.
+
+	The splits are worked out from the row where each day starts, and slices() gives them as slices of the sorted rows,
+	so selecting a split's rows is a view rather than a fancy index copy.  split() gives index arrays like sklearn's
+	splitters for code that needs them.
+	'''
+	def __init__(self, game_dates, n_splits=None, test_days=1, min_train_days=1, max_train_days=None):
+		"""
+		Parameters
+		-----------
+			game_dates : array-like
+				the date of every row, in order.  Must be sorted
+			n_splits : int
+				number of splits, taken from the end of the data.  None (or 0) for as many as there are test blocks
+			test_days : int
+				days in each test block
+			min_train_days : int
+				days every split trains on at least
+			max_train_days : int
+				train on at most this many days before the test block.  None for everything before it
+		"""
+		days = pd.to_datetime(pd.Series(game_dates)).values.astype('datetime64[D]').astype('int64')
+		if (np.diff(days) < 0).any():
+			raise ValueError("Rows have to be sorted by date to split them by day")
+
+		#row where each day starts, plus the end of the last day
+		new_day = np.ones(len(days), dtype=bool)
+		new_day[1:] = days[1:] != days[:-1]
+		self.day_starts = np.append(np.flatnonzero(new_day), len(days))
+		num_days = len(self.day_starts) - 1
+
+		#first day of each test block, the last block ending on the last day
+		self.test_starts = np.arange(num_days - test_days, min_train_days - 1, -test_days)[::-1]
+		if n_splits:
+			if n_splits > len(self.test_starts):
+				raise ValueError("Only " + str(len(self.test_starts)) + " splits of " + str(test_days) + " days possible, asked for " + str(n_splits))
+			self.test_starts = self.test_starts[-n_splits:]
+
+		self.test_days = test_days
+		self.max_train_days = max_train_days
+		self.n_splits = len(self.test_starts)
+
+	def get_n_splits(self, X=None, y=None, groups=None):
+		return self.n_splits
+
+	def slices(self):
+		'''(train, test) row slices for every split, in order'''
+		for test_start in self.test_starts:
+			train_start = 0 if self.max_train_days is None else max(test_start - self.max_train_days, 0)
+			yield slice(self.day_starts[train_start], self.day_starts[test_start]), \
+				slice(self.day_starts[test_start], self.day_starts[test_start + self.test_days])
+
+	def split(self, X=None, y=None, groups=None):
+		'''(train, test) row index arrays for every split, like TimeSeriesSplit.split'''
+		for train, test in self.slices():
+			yield np.arange(train.start, train.stop), np.arange(test.start, test.stop)
+
 class CrossValidator(object):
 
-	def train_test_split(self, X, y, num_splits = 2):
+	#note - game_id isn't a feature, but we remove it in the cross-validation stage
+	#FeatureEngineer.calc_features can take this list to compute only these features
+	KNOWN_GOOD_BATTING_FEATURES = ['game_id','PA_ytdavg', 'home_run_ytdavg', 'PA_14dayavg', 'RBI_ytdavg', 'slugging_perc_7dayavg', 'slugging_perc_14dayavg', 'pitches_ytdavg', 'single_ytdavg', 'PA_21dayavg', 'strikes_total_ytdavg']
+
+	def train_test_split(self, X, y, num_splits = 2, by_day=False, test_days=1):
 		'''
 			This function should be called on any data we are using to split it before we do anything into training, development and test data.
 
@@ -23,20 +111,38 @@ class CrossValidator(object):
 		--------------
 		df : dataframe
 			dataframe of features and a column called ['fd_score']
+		num_splits : int
+			number of splits.  0 for as many as possible (one per test block of days with by_day)
+		by_day : bool
+			split on whole game days with a DaySplit instead of on row counts, so no day is in both a split's training and
+			test rows.  Dates come from game_date, or the start of roto_game_id if there is no game_date column
+		test_days : int
+			days in each test block when by_day
 
 		Returns
 		--------------
 		X : pandas dataframe
-			dataframe of features
+			dataframe of features.  Sorted by date when by_day
 		y : pandas Series
 			target to predict
-		tscv : sklearn.model_selection._split.TimeSeriesSplit
+		tscv : sklearn.model_selection._split.TimeSeriesSplit or DaySplit
 			Provides the indices to use for walk-along cross-fold validation on X and y
 		'''
 
 		#check to make sure input is the right type
 		assert isinstance(X, pd.DataFrame), 'X should be a Pandas DataFrame'
 
+		if by_day:
+			game_dates = X['game_date'] if 'game_date' in X.columns else X['roto_game_id'].str[:10]
+			game_dates = pd.to_datetime(game_dates)
+
+			#the splits are ranges of rows, so the rows have to be in date order
+			if not game_dates.is_monotonic_increasing:
+				order = np.argsort(game_dates.to_numpy(), kind='stable')
+				X, y, game_dates = X.iloc[order], y.iloc[order], game_dates.iloc[order]
+
+			return X, y, DaySplit(game_dates, n_splits=num_splits, test_days=test_days)
+
 		if num_splits == 0:
 			num_splits = len(X) - 1
 
@@ -73,8 +179,7 @@ class CrossValidator(object):
 				dataframe limited to known good features and new columns
 		'''
 		if batting == True:
-			#note - game_id isn't a feature, but we remove it in the cross-validation stage
-			known_good_batting_features = ['game_id','PA_ytdavg', 'home_run_ytdavg', 'PA_14dayavg', 'RBI_ytdavg', 'slugging_perc_7dayavg', 'slugging_perc_14dayavg', 'pitches_ytdavg', 'single_ytdavg', 'PA_21dayavg', 'strikes_total_ytdavg']
+			known_good_batting_features = self.KNOWN_GOOD_BATTING_FEATURES
 			if len(new_features) > 0:
 				features_to_keep = list(set(known_good_batting_features).union(set(new_features)))
 				return X[features_to_keep]
@@ -94,11 +199,46 @@ class CrossValidator(object):
 			print("Either batting or pitching flag must be true!")
 			return ''
 
-	def cross_validate(self, X, y, tscv, model, fillna=False):
+	def cross_validate(self, X, y, tscv, model, fillna=False, n_jobs=1, threads_per_model=None):
+		'''
+		Walk-forward cross validation: fit the model on each split's training rows and score it on the test rows
+
+		Parameters
+		-----------------
+			X : pandas dataframe
+				features plus the roto_game_id column
+			y : pandas series
+				target
+			tscv : TimeSeriesSplit
+				from train_test_split
+			model : estimator
+				anything with fit and predict
+			fillna : bool
+				fill NaN features with 0, for models that can't handle them
+			n_jobs : int
+				number of processes to run folds in.  1 runs them one after another in this process, None uses every core.
+				With more than 1 the features must be numeric - they are put in shared memory once and each fold takes
+				its rows from there
+			threads_per_model : int
+				threads each fold's model may use (its n_jobs parameter, set on a copy of the model, and the OpenMP/BLAS
+				thread counts in the workers)
+
+		After running, train_maes, test_maes, fold_times and fold_preds (test predictions) hold one entry per split in
+		split order, and model, X_train, X_test and test_preds are from the last split
+		'''
+		#work on a copy so the caller's estimator keeps its own n_jobs
+		if threads_per_model is not None and hasattr(model, 'get_params') and 'n_jobs' in model.get_params():
+			model = copy.deepcopy(model).set_params(n_jobs=threads_per_model)
+
+		if n_jobs != 1:
+			return self._cross_validate_parallel(X, y, tscv, model, fillna, n_jobs, threads_per_model)
+
 		i = 0
 		self.test_maes = []
 		self.train_maes = []
-		for train_index, test_index in tscv.split(X):
+		self.fold_times = []
+		self.fold_preds = []
+		for train_index, test_index in _split_folds(tscv, X):
 			start = time.time()
 			print("Running iter: " + str(i+1))
 			self.X_train, self.X_test = X.iloc[train_index], X.iloc[test_index]
@@ -106,8 +246,8 @@ class CrossValidator(object):
 
 			#some models, like XGBoost handle nas, others don't.  Fill NAs if flag is set
 			if fillna == True:
-				X_train.fillna(0, inplace=True)
-				X_test.fillna(0, inplace=True)
+				self.X_train = self.X_train.fillna(0)
+				self.X_test = self.X_test.fillna(0)
 
 			#remove the ids so we can link them back up to predictions later
 			self.X_train_ids = self.X_train['roto_game_id']
@@ -127,12 +267,167 @@ class CrossValidator(object):
 			#record the results
 			self.train_maes.append(mean_absolute_error(self.y_train, self.train_preds))
 			self.test_maes.append(mean_absolute_error(self.y_test, self.test_preds))
+			self.fold_times.append(time.time()-start)
+			self.fold_preds.append(np.asarray(self.test_preds))
 			print("Iter " + str(i+1) + " took " + str(time.time()-start) + " seconds.")
 			i += 1
 		#if we are at the last iteration, lets return the predicted values from the test set so we can
 		#put them into the optimizer
 		self.id_preds = list(zip(self.test_preds, self.X_test_ids))
 
+	def _cross_validate_parallel(self, X, y, tscv, model, fillna, n_jobs, threads_per_model):
+		#one float64 copy of the features in shared memory - folds are slices of it instead of X.iloc copies
+		features = X.drop('roto_game_id', axis=1)
+		matrix = features.to_numpy(dtype='float64')
+		if fillna == True:
+			matrix = np.where(np.isnan(matrix), 0.0, matrix)
+
+		splits = list(_split_folds(tscv, X))
+		blocks = []
+		saved_env = {}
+		try:
+			shm, matrix_spec = _to_shared(matrix)
+			blocks.append(shm)
+			shm, target_spec = _to_shared(np.asarray(y, dtype='float64'))
+			blocks.append(shm)
+			del matrix
+
+			tasks = []
+			for i, (train_index, test_index) in enumerate(splits):
+				tasks.append({'fold': i, 'train': _index_slice(train_index), 'test': _index_slice(test_index), 'X': matrix_spec, 'y': target_spec, \
+							'columns': list(features.columns), 'model': model, 'keep_model': i == len(splits) - 1})
+
+			pool_args = {'max_workers': n_jobs, 'initializer': _init_fold_worker, 'initargs': (threads_per_model,)}
+			if threads_per_model is not None and threadpool_limits is None:
+				#the thread counts are only read when numpy and friends are imported, and forked workers inherit this
+				#process's already loaded libraries - so start fresh workers with the variables already set instead
+				saved_env = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+				os.environ.update({var: str(threads_per_model) for var in THREAD_ENV_VARS})
+				pool_args['mp_context'] = multiprocessing.get_context('spawn')
+
+			print("Running " + str(len(tasks)) + " iters in parallel...")
+			with ProcessPoolExecutor(**pool_args) as pool:
+				results = list(pool.map(_fold_task, tasks))
+		finally:
+			for shm in blocks:
+				shm.close()
+				shm.unlink()
+
+			for var, value in saved_env.items():
+				if value is None:
+					os.environ.pop(var, None)
+				else:
+					os.environ[var] = value
+
+		#results come back in split order
+		self.train_maes = [result['train_mae'] for result in results]
+		self.test_maes = [result['test_mae'] for result in results]
+		self.fold_times = [result['seconds'] for result in results]
+		self.fold_preds = [result['test_preds'] for result in results]
+
+		#keep the last split around like the serial version does, for log_model and the optimizer
+		train_index, test_index = splits[-1]
+		self.model = results[-1]['model']
+		self.X_train, self.X_test = features.iloc[train_index], features.iloc[test_index]
+		self.y_train, self.y_test = y.iloc[train_index], y.iloc[test_index]
+		self.X_train_ids, self.X_test_ids = X['roto_game_id'].iloc[train_index], X['roto_game_id'].iloc[test_index]
+		self.train_preds, self.test_preds = results[-1]['train_preds'], results[-1]['test_preds']
+
+		self.id_preds = list(zip(self.test_preds, self.X_test_ids))
+
+	def cross_validate_incremental(self, X, y, tscv, model, new_rounds=10, refit_every=10, compare=False, fillna=False):
+		'''
+		Walk-forward cross validation for boosted tree models that keeps boosting the previous split's model instead of
+		refitting it.  Expanding splits train on the previous split's rows plus the days added since, so each split adds
+		new_rounds rounds fitted on just the added rows; every refit_every splits the model is refit from scratch on all
+		training rows so the warm started trees don't drift too far
+
+		Parameters
+		-----------------
+			X, y, tscv, fillna : same as cross_validate
+			model : estimator
+				xgboost (continued with xgb_model), lightgbm (init_model) or a sklearn model with warm_start
+			new_rounds : int
+				boosting rounds added per split
+			refit_every : int
+				refit from scratch every this many splits (the first split is always a full fit).  None never refits
+			compare : bool
+				also refit a copy from scratch on every split to measure the difference in test MAE.  Costs as much as
+				cross_validate on top of the incremental run
+
+		After running, test_maes, train_maes, fold_times, fold_preds and refit_folds (whether the split was refit) hold
+		one entry per split.  With compare, refit_test_maes and refit_fold_times hold the full refit numbers and
+		mae_difference is the mean test MAE change from warm starting (positive is worse)
+		'''
+		base_params = model.get_params()
+
+		self.test_maes = []
+		self.train_maes = []
+		self.fold_times = []
+		self.fold_preds = []
+		self.refit_folds = []
+		self.refit_test_maes = []
+		self.refit_fold_times = []
+
+		previous_index = None
+		for i, (train_index, test_index) in enumerate(_split_folds(tscv, X)):
+			start = time.time()
+			self.X_train, self.X_test = X.iloc[train_index], X.iloc[test_index]
+			self.y_train, self.y_test = y.iloc[train_index], y.iloc[test_index]
+
+			if fillna == True:
+				self.X_train = self.X_train.fillna(0)
+				self.X_test = self.X_test.fillna(0)
+
+			self.X_train_ids = self.X_train['roto_game_id']
+			self.X_train = self.X_train.drop('roto_game_id', axis=1)
+			self.X_test_ids = self.X_test['roto_game_id']
+			self.X_test = self.X_test.drop('roto_game_id', axis=1)
+
+			#only keep boosting if this split's training rows really are the last split's plus some new ones
+			new_rows = None
+			if previous_index is not None and (refit_every is None or i % refit_every != 0):
+				new_rows = _added_rows(train_index, previous_index)
+				if new_rows is None:
+					print("Iter " + str(i+1) + " doesn't contain the previous training rows, refitting")
+
+			if new_rows is None:
+				self.model = model.set_params(**base_params).fit(self.X_train, self.y_train)
+			else:
+				new_X = X.iloc[new_rows].drop('roto_game_id', axis=1)
+				if fillna == True:
+					new_X = new_X.fillna(0)
+				if len(new_X) > 0:
+					self.model = _continue_boosting(model, new_X, y.iloc[new_rows], new_rounds)
+			previous_index = train_index
+
+			self.train_preds = self.model.predict(self.X_train)
+			self.test_preds = self.model.predict(self.X_test)
+
+			self.train_maes.append(mean_absolute_error(self.y_train, self.train_preds))
+			self.test_maes.append(mean_absolute_error(self.y_test, self.test_preds))
+			self.fold_times.append(time.time()-start)
+			self.fold_preds.append(np.asarray(self.test_preds))
+			self.refit_folds.append(new_rows is None)
+
+			if compare:
+				start = time.time()
+				refit_model = copy.deepcopy(model).set_params(**base_params).fit(self.X_train, self.y_train)
+				self.refit_test_maes.append(mean_absolute_error(self.y_test, refit_model.predict(self.X_test)))
+				self.refit_fold_times.append(time.time()-start)
+
+			print("Iter " + str(i+1) + (" (refit)" if new_rows is None else "") + " took " + str(self.fold_times[-1]) + " seconds.")
+
+		#leave the model with its original settings for log_model
+		model.set_params(**base_params)
+		self.id_preds = list(zip(self.test_preds, self.X_test_ids))
+
+		if compare:
+			self.mae_difference = np.mean(self.test_maes) - np.mean(self.refit_test_maes)
+			print("Incremental test MAE " + str(np.mean(self.test_maes)) + " vs full refits " + str(np.mean(self.refit_test_maes)) + \
+					" (difference " + str(self.mae_difference) + ")")
+			print("Incremental took " + str(np.sum(self.fold_times)) + " seconds vs " + str(np.sum(self.refit_fold_times)) + " for full refits")
+
 	def log_model(self, notes=""):
 		'''
 		The goal of this is to log a model stored in the current instance of the object
@@ -164,94 +459,968 @@ class CrossValidator(object):
 
 		results.to_csv("logged_results.csv", mode='a', header=False, index=False)
 
-class MovingAverageModel(object):
-	#def __init__(self):
+#spacing between players in PlayerPanel.player_day - more days than any career
+DAYS_PER_PLAYER = 1000000
+
+#row bookkeeping arrays of a PlayerPanel, shared with the parallel feature workers
+PANEL_LAYOUT = ['player_start', 'games_before', 'days', 'player_code', 'player_day', 'season_start']
+
+class PlayerPanel(object):
+	'''
+	The numeric columns of a player-game dataframe as one float64 array, in player then date order, along with
+	per-column prefix sums and non-null counts.  Any trailing window of any column for every row is then just a
+	difference of two prefix sums, so features for all columns are computed at once instead of one groupby per column.
+
+	The frame passed in must already be sorted by player and date (FeatureEngineer.avg_df is).
+	'''
+	def __init__(self, df, cols):
+		self.index = df.index
+		self.cols = list(cols)
+
+		n = len(df)
+		self.rows = np.arange(n)
+
+		#the row where each row's player starts, and how many earlier games the player has
+		player = np.asarray(df['player'].astype(str))
+		new_player = np.ones(n, dtype=bool)
+		new_player[1:] = player[1:] != player[:-1]
+		self.player_start = np.maximum.accumulate(np.where(new_player, self.rows, 0))
+		self.games_before = self.rows - self.player_start
+
+		#days since 1970 for each game, and a (player, day) key that is sorted across the whole panel so we can binary search it
+		self.days = pd.to_datetime(df['game_date']).values.astype('datetime64[D]').astype('int64')
+		self.player_code = np.cumsum(new_player) - 1
+		self.player_day = self.player_code * DAYS_PER_PLAYER + self.days
+
+		#the row where each row's (player, season) starts - for year to date windows
+		if 'year' in df.columns:
+			years = df['year'].to_numpy()
+			new_season = new_player.copy()
+			new_season[1:] |= years[1:] != years[:-1]
+			self.season_start = np.maximum.accumulate(np.where(new_season, self.rows, 0))
+
+		self._set_values(df[self.cols].to_numpy(dtype='float64'))
+
+	@classmethod
+	def from_arrays(cls, cols, values, layout, prefix_sums=None):
+		'''
+		Rebuild a panel from its column values and the row bookkeeping arrays returned by layout() - used by the parallel
+		workers, which get those arrays from shared memory instead of a dataframe.  prefix_sums is an already computed
+		(csum, ccount) pair for the same columns, so they don't have to be summed again
+		'''
+		panel = cls.__new__(cls)
+		panel.index = None
+		panel.cols = list(cols)
+		panel.rows = np.arange(len(values))
+		for name, values_array in layout.items():
+			setattr(panel, name, values_array)
+
+		if prefix_sums is None:
+			panel._set_values(values)
+		else:
+			panel.values = values
+			panel.csum, panel.ccount = prefix_sums
+
+		return panel
 
-	def fit(self, X, y, num_days=5):
+	def layout(self):
+		'''The per-row bookkeeping arrays (everything but the column values), by attribute name'''
+		return {name: getattr(self, name) for name in PANEL_LAYOUT if hasattr(self, name)}
 
-		self.X = X
-		self.y = y
+	def _set_values(self, values):
+		n = len(values)
+		self.values = values
 
-		self.X['fd_score'] = y
+		#prefix sums with a leading row of zeros, so csum[i] is the sum of everything above row i
+		notnull = ~np.isnan(self.values)
+		self.csum = np.zeros((n + 1, len(self.cols)))
+		np.cumsum(np.where(notnull, self.values, 0.0), axis=0, out=self.csum[1:])
+		self.ccount = np.zeros((n + 1, len(self.cols)), dtype='int64')
+		np.cumsum(notnull, axis=0, out=self.ccount[1:])
 
-		#calculate moving average for every game in X
-		mov_df  = self.X.groupby(['player', 'game_date', 'game_id'])['fd_score'].min().reset_index()
-		mov_df['moving_avg'] = mov_df.groupby('player')['fd_score'].apply(lambda x: x.rolling(num_days, 1).mean())
+	def window_sums(self, start, end):
+		'''
+		Sum and non-null count of every column over rows [start, end) for each row.  start and end are arrays of row positions
+		'''
+		return self.csum[end] - self.csum[start], self.ccount[end] - self.ccount[start]
 
-		#combine it back with the original feature set
-		self.fitted_X = pd.merge(self.X, mov_df[['game_id', 'moving_avg']], on = 'game_id')
+	def rolling_means(self, windows):
+		"""
+		Mean of each column over the previous N games of the same player, for every N in windows.  The current game is never
+		included.  Same as groupby-rolling(N, N).mean().shift(): NaN unless there are N earlier games with no missing values
 
-		self.fitted_X = self.fitted_X[['player', 'game_date', 'game_id', 'moving_avg']]
+		Parameters
+		-----------
+			windows : list
+				window lengths in games
 
-		#sort it by player and game.  Predict function will look at a date and get the moving avg from the most recent game before it
-		self.fitted_X.sort_values(['player', 'game_date', 'game_id'], inplace=True)
+		Returns
+		-----------
+			numpy array
+				n_rows x (n_cols * n_windows), ordered column by column then window by window
+		"""
+		out = np.empty((len(self.rows), len(self.cols), len(windows)))
 
-		#get rid of the target column in the feature df
-		X.drop('fd_score', inplace=True, axis=1)
+		for j, window in enumerate(windows):
+			sums, counts = self.window_sums(np.maximum(self.rows - window, 0), self.rows)
 
-		del mov_df
+			means = sums / window
+			means[(counts < window) | (self.games_before < window)[:, None]] = np.nan
+			out[:, :, j] = means
 
-	def predict(self, X):
-		'''
+		return out.reshape(len(self.rows), len(self.cols) * len(windows))
 
-		'''
-		#for every row in X, predict the fanduel score based on moving average of preceding games
-		predictions = X.apply(self.get_moving_avg, axis = 1)
+	def expanding_means(self):
+		"""
+		Mean of each column over all of the player's earlier games.  Same as groupby-expanding().mean().shift() with the
+		player's first game set to NaN
+
+		Returns
+		-----------
+			numpy array
+				n_rows x n_cols
+		"""
+		sums, counts = self.window_sums(self.player_start, self.rows)
 
-		return predictions
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return np.where(counts > 0, sums / counts, np.nan)
 
+	def ytd_means(self):
+		"""
+		Mean of each column over the player's earlier games in the same season.  Matches calc_ytd_avgs, where the first
+		game of a season (other than a player's first game ever) gets the average of the player's whole previous season
 
-	def get_moving_avg(self, row):
-		'''
-			Helper function that looks up the moving average in fitted X values based on the player name and the game date
-
-			Parameters
-			--------------
-			row : Pandas series
-				Expected to contain keys 'player' and 'game_date'
-
-			Returns
-			--------------
-			float
-				the predicted value for the given player and game_date
-				returns mean of all values if not enough rows to calculate
-		'''
+		Returns
+		-----------
+			numpy array
+				n_rows x n_cols
+		"""
+		start = self.season_start.copy()
+
+		#first game of a season looks back over the previous row's season
+		first_of_season = (start == self.rows) & (self.games_before > 0)
+		start[first_of_season] = self.season_start[self.rows[first_of_season] - 1]
 
-		#since fitted_x is sorted by player and date, we can simply look up the game
-		#right before the one we want to predict and get the moving average from it
+		sums, counts = self.window_sums(start, self.rows)
 
-		#we can use game date here because we aren't concerned about double headers.  We always want a game from a preceding day
-		filtered_df = self.fitted_X[(self.fitted_X['player'] == row['player']) & (self.fitted_X['game_date'] < row['game_date'])]
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return np.where(counts > 0, sums / counts, np.nan)
 
-		#we filtered out all games > prediction date, so the most recent moving average is the
-		#last row in the filtered df - return it as the prediction
-		val = filtered_df.tail(1)['moving_avg'].values
+	def ewm_means(self, halflives, calendar_days=False):
+		"""
+		Exponentially weighted mean of each column over the player's earlier games, for every half-life in halflives.  The
+		current game is never included.  A game's weight halves every halflife games back (or every halflife calendar days
+		back if calendar_days), so the same as groupby-ewm(halflife).mean().shift() with the player's first game set to NaN
 
-		if np.isnan(val):
-			return self.y.mean()
+		This is a recurrence down each player's games, s[i] = decay * (s[i-1] + x[i-1]), run for every player at once: step
+		k updates every player's k-th game, so there is one vectorized step per game of the longest career
+
+		Parameters
+		-----------
+			halflives : list
+				half-lives in games, or in days if calendar_days
+			calendar_days : bool
+				decay by the days between games instead of by the number of games
+
+		Returns
+		-----------
+			numpy array
+				n_rows x (n_cols * n_halflives), ordered column by column then half-life by half-life
+		"""
+		n = len(self.rows)
+		halflives = np.asarray(halflives, dtype='float64')
+
+		#decay from the previous game to this one, for each half-life
+		if calendar_days:
+			gap = np.zeros(n)
+			gap[1:] = self.days[1:] - self.days[:-1]
+			decay = 0.5 ** (gap[:, None] / halflives[None, :])
 		else:
-			return val
+			decay = np.broadcast_to(0.5 ** (1 / halflives), (n, len(halflives)))
+
+		notnull = ~np.isnan(self.values)
+		filled = np.where(notnull, self.values, 0.0)
+
+		#weighted sums of the values and of the weights.  a player's first game has nothing before it
+		sums = np.zeros((n, len(self.cols), len(halflives)))
+		weights = np.zeros((n, len(self.cols), len(halflives)))
+
+		#rows grouped by how many games the player had before them
+		order = np.argsort(self.games_before, kind='stable')
+		bounds = np.searchsorted(self.games_before[order], np.arange(self.games_before.max() + 2) if n > 0 else [0])
+
+		for k in range(1, len(bounds) - 1):
+			idx = order[bounds[k]:bounds[k + 1]]
+			step = decay[idx][:, None, :]
+			sums[idx] = step * (sums[idx - 1] + filled[idx - 1][:, :, None])
+			weights[idx] = step * (weights[idx - 1] + notnull[idx - 1][:, :, None])
+
+		with np.errstate(invalid='ignore', divide='ignore'):
+			means = np.where(weights > 0, sums / weights, np.nan)
+
+		return means.reshape(n, len(self.cols) * len(halflives))
+
+	def calendar_windows(self, days):
+		"""
+		Sum, non-null count and mean of each column over the games the same player played in the N calendar days before each
+		game.  Games on the same day (double headers) are never included, so nothing from the current day leaks in
+
+		Parameters
+		-----------
+			days : int
+				window length in calendar days
+
+		Returns
+		-----------
+			sums, counts, means : numpy arrays
+				n_rows x n_cols each.  means are NaN where there are no games in the window
+			games : numpy array
+				number of games in the window for each row
+		"""
+		#first game on or after day - N, and first game on or after the current day - both within the same player
+		start = np.searchsorted(self.player_day, self.player_day - days, side='left')
+		end = np.searchsorted(self.player_day, self.player_day, side='left')
+
+		sums, counts = self.window_sums(start, end)
+		with np.errstate(invalid='ignore', divide='ignore'):
+			means = np.where(counts > 0, sums / counts, np.nan)
+
+		return sums, counts, means, end - start
+
+class BaselinePanel(object):
+	'''
+	The FD points of a training set as one sorted player-date PlayerPanel, built once and shared by the baseline models.
+
+	An empty row is added after each player's last game, so for every game i the stats PlayerPanel computes for row i+1
+	(over the games before it) are the stats as of the end of game i - which is what a later prediction looks up.
+	'''
+	def __init__(self, X, y):
+		keys = ['player', 'game_date'] + (['game_id'] if 'game_id' in X.columns else [])
+
+		#one row per game, sorted by player and date - a copy, X itself is left alone
+		games = X[keys].copy()
+		games['fd_score'] = np.asarray(y, dtype='float64')
+		games = games.groupby(keys)['fd_score'].min().reset_index()
+		games['year'] = pd.to_datetime(games['game_date']).dt.year
+
+		#the empty row after each player's last game
+		last_game = np.flatnonzero(~games['player'].duplicated(keep='last').to_numpy())
+		ends = games.iloc[last_game].assign(fd_score=np.nan)
+		order = np.argsort(np.concatenate([np.arange(len(games)), last_game + 0.5]), kind='stable')
+		frame = pd.concat([games, ends], ignore_index=True).iloc[order].reset_index(drop=True)
+
+		self.panel = PlayerPanel(frame, ['fd_score'])
+		self.game_rows = np.flatnonzero(order < len(games))
+
+		#(player, day) keys of the games so predictions can binary search them
+		self.players = pd.Index(games['player'].unique())
+		self.codes = self.players.get_indexer(games['player'])
+		self.keys = self.codes * DAYS_PER_PLAYER + pd.to_datetime(games['game_date']).values.astype('datetime64[D]').astype('int64')
+
+	def as_of(self, X):
+		"""
+		Panel row holding the stats as of each row's player's most recent game on an earlier day
+
+		Parameters
+		-----------
+			X : pandas dataframe
+				with player and game_date columns
+
+		Returns
+		-----------
+			numpy array
+				panel rows, -1 where the player has no earlier game
+		"""
+		codes = self.players.get_indexer(X['player'])
+		days = pd.to_datetime(X['game_date']).values.astype('datetime64[D]').astype('int64')
+
+		#we use the day here because we aren't concerned about double headers - we always want a game from a preceding day
+		last = np.searchsorted(self.keys, codes * DAYS_PER_PLAYER + days, side='left') - 1
+		found = (codes >= 0) & (last >= 0)
+		found[found] &= self.codes[last[found]] == codes[found]
+
+		return np.where(found, self.game_rows[np.maximum(last, 0)] + 1, -1)
+
+class BaselineModel(ABC):
+	'''
+	Predicts a player's FD points from their own earlier games.  Subclasses pick the statistic in game_stats.
+
+	fit builds a BaselinePanel (or takes one already built for the same training data, so a whole family of baselines
+	shares it) and predict looks every row up as of the player's last game before its date.  Players without one get the
+	mean of the training targets.
+	'''
+	def fit(self, X, y, panel=None):
+		self.panel = panel if panel is not None else BaselinePanel(X, y)
+		self.mean = float(np.nanmean(np.asarray(y, dtype='float64')))
+		self.stats = self.game_stats(self.panel.panel)
+
+		return self
+
+	def predict(self, X):
+		rows = self.panel.as_of(X)
+		found = rows >= 0
+
+		predictions = np.full(len(X), self.mean)
+		values = self.stats[rows[found]]
+		predictions[found] = np.where(np.isnan(values), self.mean, values)
+
+		return pd.Series(predictions, index=X.index)
+
+	@abstractmethod
+	def game_stats(self, panel):
+		'''The statistic for every row of the panel, over the player's games before that row'''
+
+class RollingMeanModel(BaselineModel):
+	'''Mean FD points over the player's last num_games games (fewer if they haven't played that many)'''
+	def __init__(self, num_games=5):
+		self.num_games = num_games
+
+	def game_stats(self, panel):
+		sums, counts = panel.window_sums(np.maximum(panel.rows - self.num_games, panel.player_start), panel.rows)
+
+		with np.errstate(invalid='ignore', divide='ignore'):
+			return np.where(counts > 0, sums / counts, np.nan)[:, 0]
+
+class MovingAverageModel(RollingMeanModel):
+	'''The original baseline - a rolling mean over the last num_days games'''
+	def __init__(self, num_days=5):
+		self.num_games = num_days
+
+	def fit(self, X, y, num_days=None, panel=None):
+		if num_days is not None:
+			self.num_games = num_days
+
+		return super(MovingAverageModel, self).fit(X, y, panel=panel)
+
+class LastGameModel(RollingMeanModel):
+	'''FD points in the player's last game'''
+	def __init__(self):
+		self.num_games = 1
+
+class RollingMedianModel(BaselineModel):
+	'''Median FD points over the player's last num_games games - less swayed by one big game than the mean'''
+	def __init__(self, num_games=5):
+		self.num_games = num_games
+
+	def game_stats(self, panel):
+		#the previous num_games rows of each row, NaN where they belong to another player
+		lookback = panel.rows[:, None] - np.arange(1, self.num_games + 1)[None, :]
+		window = np.where(lookback >= panel.player_start[:, None], panel.values[np.maximum(lookback, 0), 0], np.nan)
+
+		with warnings.catch_warnings():
+			#players with no earlier games are all NaN on purpose
+			warnings.simplefilter('ignore', RuntimeWarning)
+			return np.nanmedian(window, axis=1)
+
+class EWMAModel(BaselineModel):
+	'''Exponentially weighted mean FD points, where a game's weight halves every halflife games back'''
+	def __init__(self, halflife=5):
+		self.halflife = halflife
+
+	def game_stats(self, panel):
+		return panel.ewm_means([self.halflife])[:, 0]
+
+class SeasonMeanModel(BaselineModel):
+	'''Mean FD points so far this season.  Until a player's first game of a new season it is their previous season's mean'''
+	def game_stats(self, panel):
+		return panel.ytd_means()[:, 0]
+
+def fit_baselines(X, y, models=None):
+	"""
+	Fit a family of baseline models on one shared BaselinePanel
+
+	Parameters
+	-----------
+		X : pandas dataframe
+			training rows with player and game_date (and game_id if there is one) columns.  Not modified
+		y : array-like
+			FD points for each row
+		models : dict
+			name -> unfitted BaselineModel.  Defaults to a 5 and 15 game rolling mean, 5 game median, 5 game EWMA,
+			season mean and last game
+
+	Returns
+	-----------
+		dict
+			name -> fitted model
+	"""
+	if models is None:
+		models = {'rolling_mean_5': RollingMeanModel(5), 'rolling_mean_15': RollingMeanModel(15), 'rolling_median_5': RollingMedianModel(5), \
+				'ewma_5': EWMAModel(5), 'season_mean': SeasonMeanModel(), 'last_game': LastGameModel()}
+
+	panel = BaselinePanel(X, y)
+
+	return {name: model.fit(X, y, panel=panel) for name, model in models.items()}
+
+class OnlineFeatureState(object):
+	'''
+	Per-player running state for the lifetime, year to date and rolling (last N games) averages, so features for a new day
+	can be produced from yesterday's state instead of recomputing every player's whole history.
+
+	For each player we keep the lifetime sums and non-null counts of every column, the same for the player's current season,
+	and the player's last max(windows) games.  Features match FeatureEngineer.calc_lifetime_avg, calc_ytd_avgs and
+	calc_rolling_avg - including the batch behaviour where a player's first game of a season gets the full average of his
+	previous season as its ytd average.
+
+	Build one with FeatureEngineer.online_state() (or from_history), then call advance() with each new day of box scores.
+	'''
+	def __init__(self, cols, windows):
+		self.cols = list(cols)
+		self.windows = list(windows)
+		self.players = {}
+
+	@classmethod
+	def from_history(cls, df, cols, windows):
+		"""
+		Build the state from a history of player games in one pass over the frame
+
+		Parameters
+		-----------
+			df : pandas dataframe
+				player games with 'player', 'game_date', 'year' and the feature columns
+			cols : list
+				numeric columns to keep state for
+			windows : list
+				rolling window lengths, in games
+		"""
+		state = cls(cols, windows)
+		history = max(state.windows)
+
+		df = df.sort_values(['player', 'game_date'])
+		player = df['player'].astype(str)
+		groups = df.groupby(player, sort=False)
+
+		life_sums = groups[state.cols].sum()
+		life_counts = groups[state.cols].count()
+		last_year = groups['year'].last()
+		games = groups.size()
+
+		#season totals only count the games in each player's latest season
+		season = df[df['year'].to_numpy() == player.map(last_year).to_numpy()].groupby(player, sort=False)[state.cols]
+		season_sums = season.sum()
+		season_counts = season.count()
+
+		recent = groups.tail(history)
+		for player_id, rows in recent.groupby(player, sort=False):
+			rows = rows[state.cols].to_numpy(dtype='float64')
+			padded = np.full((history, len(state.cols)), np.nan)
+			padded[history - len(rows):] = rows
+
+			state.players[player_id] = {
+				'games': int(games[player_id]),
+				'life_sum': life_sums.loc[player_id].to_numpy(dtype='float64'),
+				'life_count': life_counts.loc[player_id].to_numpy(dtype='int64'),
+				'year': last_year[player_id],
+				'season_sum': season_sums.loc[player_id].to_numpy(dtype='float64'),
+				'season_count': season_counts.loc[player_id].to_numpy(dtype='int64'),
+				'recent': padded,
+			}
+
+		return state
+
+	def feature_names(self):
+		'''Names of the feature columns, in the order they are returned'''
+		names = [col + '_lifeavg' for col in self.cols]
+		names += [col + '_ytdavg' for col in self.cols]
+		names += [col + '_' + str(window) + 'dayavg' for col in self.cols for window in self.windows]
+		return names
+
+	def features(self, df):
+		"""
+		Features for a slate of upcoming games from the current state, without changing it.  Only 'player' is needed
+
+		Returns
+		-----------
+			pandas dataframe
+				one row per row of df with the feature_names() columns, same index as df
+		"""
+		out = np.full((len(df), len(self.feature_names())), np.nan)
+
+		for i, player in enumerate(df['player'].astype(str)):
+			record = self.players.get(player)
+			if record is not None:
+				out[i] = self._player_features(record)
+
+		return pd.DataFrame(out, columns=self.feature_names(), index=df.index)
+
+	def advance(self, df):
+		"""
+		Add a day (or more) of box scores to the state.  Each row's features are computed from the state just before that row
+		is added, so the returned features are what the batch FeatureEngineer methods give for those rows
+
+		Parameters
+		-----------
+			df : pandas dataframe
+				new player games with 'player', 'year' and the feature columns, in date order
+
+		Returns
+		-----------
+			pandas dataframe
+				features for each row of df, same index as df
+		"""
+		values = df[self.cols].to_numpy(dtype='float64')
+		years = df['year'].to_numpy()
+		out = np.full((len(df), len(self.feature_names())), np.nan)
+
+		for i, player in enumerate(df['player'].astype(str)):
+			record = self.players.get(player)
+
+			if record is None:
+				record = self._new_record(years[i])
+				self.players[player] = record
+			else:
+				out[i] = self._player_features(record)
+
+			self._add_game(record, values[i], years[i])
+
+		return pd.DataFrame(out, columns=self.feature_names(), index=df.index)
+
+	def _new_record(self, year):
+		k = len(self.cols)
+		return {'games': 0, 'life_sum': np.zeros(k), 'life_count': np.zeros(k, dtype='int64'), 'year': year, \
+				'season_sum': np.zeros(k), 'season_count': np.zeros(k, dtype='int64'), 'recent': np.full((max(self.windows), k), np.nan)}
+
+	def _player_features(self, record):
+		with np.errstate(invalid='ignore', divide='ignore'):
+			life = np.where(record['life_count'] > 0, record['life_sum'] / record['life_count'], np.nan)
+			ytd = np.where(record['season_count'] > 0, record['season_sum'] / record['season_count'], np.nan)
+
+		#a NaN anywhere in the last N games makes the N game average NaN, same as rolling(N, N)
+		rolling = np.column_stack([record['recent'][-window:].sum(axis=0) / window for window in self.windows]).ravel()
+
+		return np.concatenate([life, ytd, rolling])
+
+	def _add_game(self, record, values, year):
+		notnull = ~np.isnan(values)
+		filled = np.where(notnull, values, 0.0)
+
+		record['games'] += 1
+		record['life_sum'] = record['life_sum'] + filled
+		record['life_count'] = record['life_count'] + notnull
+
+		if year != record['year']:
+			record['year'] = year
+			record['season_sum'] = np.zeros(len(self.cols))
+			record['season_count'] = np.zeros(len(self.cols), dtype='int64')
+		record['season_sum'] = record['season_sum'] + filled
+		record['season_count'] = record['season_count'] + notnull
+
+		record['recent'] = np.vstack([record['recent'][1:], values])
+
+	def save(self, filepath):
+		with open(filepath, 'wb') as f:
+			pickle.dump(self, f)
+
+	@classmethod
+	def load(cls, filepath):
+		with open(filepath, 'rb') as f:
+			return pickle.load(f)
+
+class MatchupHistory(object):
+	'''
+	Running totals of each batter's plate appearances against each pitcher, from DatabaseHelper.pull_matchup_events.
+
+	Totals are kept per (batter, pitcher, day) sorted in that order with a cumulative sum down the rows, so a batter's
+	history against a pitcher before any date is one binary search and a subtraction - for any number of lookups at once.
+	'''
+	STATS = ['pa', 'ab', 'hits', 'total_bases', 'walks', 'strikeouts']
+
+	def __init__(self, matchups):
+		#one row per batter, pitcher and day.  double headers are added together since we only look before a date
+		daily = matchups.groupby(['batter', 'pitcher', 'game_date'])[self.STATS].sum().reset_index()
+
+		self.pairs = pd.MultiIndex.from_frame(daily[['batter', 'pitcher']].drop_duplicates())
+		self.pair = self.pairs.get_indexer(pd.MultiIndex.from_frame(daily[['batter', 'pitcher']]))
+		self.keys = self.pair * DAYS_PER_PLAYER + pd.to_datetime(daily['game_date']).values.astype('datetime64[D]').astype('int64')
+
+		#cumulative totals with a leading row of zeros, and the first row of each pair
+		self.csum = np.zeros((len(daily) + 1, len(self.STATS)), dtype='int64')
+		np.cumsum(daily[self.STATS].to_numpy(dtype='int64'), axis=0, out=self.csum[1:])
+		self.pair_start = np.searchsorted(self.pair, np.arange(len(self.pairs)))
+
+	def before(self, batters, pitchers, game_dates):
+		"""
+		Totals of each batter against each pitcher in games strictly before the date
+
+		Parameters
+		-----------
+			batters, pitchers : array-like
+				mlbam ids
+			game_dates : array-like
+				dates of the games to look up
+
+		Returns
+		-----------
+			numpy array
+				n x len(STATS) totals, zeros for pairs with no earlier plate appearances
+		"""
+		pair = self.pairs.get_indexer(pd.MultiIndex.from_arrays([np.asarray(batters, dtype='int64'), np.asarray(pitchers, dtype='int64')]))
+		days = pd.to_datetime(pd.Series(game_dates)).values.astype('datetime64[D]').astype('int64')
+
+		#last row of the pair before the date
+		last = np.searchsorted(self.keys, pair * DAYS_PER_PLAYER + days, side='left') - 1
+		found = (pair >= 0) & (last >= 0)
+		found[found] &= self.pair[last[found]] == pair[found]
+
+		totals = np.zeros((len(pair), len(self.STATS)), dtype='int64')
+		totals[found] = self.csum[last[found] + 1] - self.csum[self.pair_start[pair[found]]]
+
+		return totals
+
+	def features(self, batters, pitchers, game_dates):
+		"""
+		Matchup history features for each batter against each pitcher before the date: plate appearances, at bats, hits and
+		batting average, slugging, on base percentage and strikeout rate.  Rates are NaN with no history
+
+		Returns
+		-----------
+			pandas dataframe
+				one row per lookup, columns named <stat>_matchup_hist
+		"""
+		totals = pd.DataFrame(self.before(batters, pitchers, game_dates), columns=self.STATS).astype('float64')
+
+		with np.errstate(invalid='ignore', divide='ignore'):
+			features = pd.DataFrame({
+				'pa_matchup_hist': totals['pa'],
+				'ab_matchup_hist': totals['ab'],
+				'hits_matchup_hist': totals['hits'],
+				'batting_avg_matchup_hist': totals['hits'] / totals['ab'],
+				'slugging_perc_matchup_hist': totals['total_bases'] / totals['ab'],
+				'on_base_perc_matchup_hist': (totals['hits'] + totals['walks']) / totals['pa'],
+				'strikeout_rate_matchup_hist': totals['strikeouts'] / totals['pa'],
+			})
+
+		return features
+
+	@staticmethod
+	def starting_pitchers(matchups):
+		"""
+		The opposing starting pitcher for every batter in every game: the pitcher who faced the first batter of the batter's
+		half of the game
+
+		Returns
+		-----------
+			pandas dataframe
+				batter, game_pk, game_date, pitcher and first_pitch, the game's earliest sv_id
+		"""
+		first = matchups.sort_values(['game_pk', 'inning_topbot', 'first_at_bat'])
+		starters = first.drop_duplicates(['game_pk', 'inning_topbot'])[['game_pk', 'inning_topbot', 'pitcher']]
+		first_pitch = matchups.groupby('game_pk')['first_pitch'].min().rename('first_pitch')
+
+		games = matchups.drop_duplicates(['batter', 'game_pk'])[['batter', 'game_pk', 'game_date', 'inning_topbot']]
+		games = games.merge(starters, on=['game_pk', 'inning_topbot'], how='inner').drop('inning_topbot', axis=1)
+
+		return games.merge(first_pitch, left_on='game_pk', right_index=True, how='left')
+
+def _start_times(times):
+	#parse game start times like '7:05 p.m.' (bbref) or '7:05 PM' (rotoguru) so they sort in time order.  NaT if unparseable
+	times = pd.Series(times).astype(str).str.replace('.', '', regex=False).str.upper().str.strip()
+	return pd.to_datetime(times, format='%I:%M %p', errors='coerce')
+
+def _game_numbers(keys, start_times=None):
+	#0 for a player's first game of the day, 1 for the second game of a double header.  Ordered by start time when given,
+	#otherwise by row order
+	order = pd.DataFrame({'key': np.asarray(keys)})
+	if start_times is not None:
+		order['start'] = _start_times(start_times).to_numpy()
+		order = order.sort_values(['key', 'start'], kind='stable')
+
+	numbers = np.empty(len(order), dtype='int64')
+	numbers[order.index.to_numpy()] = order.groupby('key').cumcount().to_numpy()
+	return numbers
+
+def _to_shared(values):
+	#copy an array into a new shared memory block.  returns the block and a (name, shape, dtype) spec workers can attach with
+	shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+	np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+	return shm, (shm.name, values.shape, values.dtype.str)
+
+def _from_shared(spec):
+	#attach to a block from _to_shared without registering it with the resource tracker - the process that created the
+	#block unlinks it, and a worker's registration would be reported (or unlinked) as a leak when the worker exits
+	if sys.version_info >= (3, 13):
+		shm = shared_memory.SharedMemory(name=spec[0], track=False)
+	else:
+		#before 3.13 attaching always registers, and unregistering afterwards would also drop the creator's entry in a
+		#tracker shared with it - so skip the register call while attaching instead
+		register = resource_tracker.register
+		resource_tracker.register = lambda name, rtype: None
+		try:
+			shm = shared_memory.SharedMemory(name=spec[0])
+		finally:
+			resource_tracker.register = register
+
+	return shm, np.ndarray(spec[1], dtype=spec[2], buffer=shm.buf)
+
+def _panel_features(panel, group, windows):
+	#the features of one group for every column in the panel, in the same column order as the FeatureEngineer methods
+	if group == 'lifetime':
+		return panel.expanding_means()
+	elif group == 'ytd':
+		return panel.ytd_means()
+	elif group == 'rolling':
+		return panel.rolling_means(windows)
+	elif group == 'ewm':
+		return panel.ewm_means(windows)
+	elif group == 'calendar':
+		means = np.stack([panel.calendar_windows(days)[2] for days in windows], axis=2)
+		return means.reshape(len(panel.rows), len(panel.cols) * len(windows))
+
+	raise ValueError("Unknown feature group " + group)
+
+def _feature_task(task):
+	#runs in a worker process: attach to the shared panel, compute one group for one batch of columns and write it into the shared output
+	start = time.time()
+	handles = []
+	try:
+		_run_feature_task(task, handles)
+	finally:
+		for shm in handles:
+			shm.close()
+
+	return task['group'], task['cols'], time.time() - start
+
+def _run_feature_task(task, handles):
+	shm, values = _from_shared(task['values'])
+	handles.append(shm)
+
+	layout = {}
+	for name, spec in task['layout'].items():
+		shm, layout[name] = _from_shared(spec)
+		handles.append(shm)
+
+	shm, out = _from_shared(task['out'])
+	handles.append(shm)
+
+	shm, csum = _from_shared(task['csum'])
+	handles.append(shm)
+	shm, ccount = _from_shared(task['ccount'])
+	handles.append(shm)
+
+	#batches are column ranges, so these are views of the shared arrays rather than copies, and the prefix sums the parent
+	#already has are used as they are
+	lo, hi = task['lo'], task['hi']
+	panel = PlayerPanel.from_arrays(task['cols'], values[:, lo:hi], layout, prefix_sums=(csum[:, lo:hi], ccount[:, lo:hi]))
+	features = _panel_features(panel, task['group'], task['windows'])
+
+	out[:, task['offset']:task['offset'] + features.shape[1]] = features
+
+def _continue_boosting(model, X, y, new_rounds):
+	#add new_rounds boosting rounds fitted on X to an already fitted model
+	if hasattr(model, 'get_booster'):
+		#xgboost - n_estimators is the number of rounds to add when continuing from xgb_model
+		booster = model.get_booster()
+		return model.set_params(n_estimators=new_rounds).fit(X, y, xgb_model=booster)
+	elif hasattr(model, 'booster_'):
+		#lightgbm
+		booster = model.booster_
+		return model.set_params(n_estimators=new_rounds).fit(X, y, init_model=booster)
+	elif 'warm_start' in model.get_params():
+		#sklearn - n_estimators is the total, and only the trees past the fitted ones are trained
+		return model.set_params(warm_start=True, n_estimators=len(model.estimators_) + new_rounds).fit(X, y)
+
+	raise ValueError("Don't know how to keep boosting a " + type(model).__name__)
+
+def _split_folds(tscv, X):
+	#row slices if the splitter can give them (DaySplit), otherwise its index arrays
+	if hasattr(tscv, 'slices'):
+		return tscv.slices()
+
+	return tscv.split(X)
+
+def _added_rows(train_index, previous_index):
+	#the rows an expanding training set added since the previous split, or None if it doesn't contain the previous one
+	if isinstance(train_index, slice) and isinstance(previous_index, slice):
+		if train_index.start == previous_index.start and train_index.stop >= previous_index.stop:
+			return slice(previous_index.stop, train_index.stop)
+		return None
+
+	new_rows = np.setdiff1d(train_index, previous_index, assume_unique=True)
+	if len(new_rows) + len(previous_index) != len(train_index):
+		return None
+
+	return new_rows
+
+def _index_slice(index):
+	#TimeSeriesSplit indices are contiguous ranges - send those as slices so folds are views of the shared matrix
+	if isinstance(index, slice):
+		return index
+
+	if len(index) > 0 and index[-1] - index[0] + 1 == len(index) and (np.diff(index) == 1).all():
+		return slice(int(index[0]), int(index[-1]) + 1)
+
+	return index
+
+def _init_fold_worker(threads):
+	#limit the thread pools of the numeric libraries in each fold worker.  Setting the environment variables here would do
+	#nothing, the libraries are already loaded - without threadpoolctl they are set before the workers start instead
+	if threads is not None and threadpool_limits is not None:
+		threadpool_limits(limits=threads)
+
+def _fold_task(task):
+	#runs in a worker process: fit and score one walk-forward split on the shared feature matrix
+	start = time.time()
+	handles = []
+	try:
+		result = _run_fold_task(task, handles)
+	finally:
+		for shm in handles:
+			try:
+				shm.close()
+			except BufferError:
+				#the model kept a view of the training rows - the block goes away with the worker
+				pass
+
+	result['seconds'] = time.time() - start
+	print("Iter " + str(task['fold'] + 1) + " took " + str(result['seconds']) + " seconds.")
+
+	return result
+
+def _run_fold_task(task, handles):
+	shm, matrix = _from_shared(task['X'])
+	handles.append(shm)
+	shm, target = _from_shared(task['y'])
+	handles.append(shm)
+
+	X_train = pd.DataFrame(matrix[task['train']], columns=task['columns'], copy=False)
+	X_test = pd.DataFrame(matrix[task['test']], columns=task['columns'], copy=False)
+	y_train, y_test = target[task['train']], target[task['test']]
+
+	model = task['model'].fit(X_train, y_train)
+	train_preds = np.array(model.predict(X_train), dtype='float64')
+	test_preds = np.array(model.predict(X_test), dtype='float64')
+
+	return {'fold': task['fold'], 'train_mae': mean_absolute_error(y_train, train_preds), 'test_mae': mean_absolute_error(y_test, test_preds), \
+			'train_preds': train_preds, 'test_preds': test_preds, 'model': model if task['keep_model'] else None}
+
+class FeatureStore(object):
+	'''
+	Stores computed feature groups on disk (parquet) along with a fingerprint of the data and code that produced them, so a
+	group is only recomputed when its inputs or its feature code change.
+
+	Each group is kept under store_dir/<group>/<fingerprint>.parquet, so older versions stay around - switching back to
+	older code or data picks up the matching version instead of recomputing.
+	'''
+	def __init__(self, store_dir='feature_store'):
+		self.store_dir = store_dir
+
+	def fingerprint(self, inputs=(), code=(), params=None):
+		"""
+		Hash the inputs, code and parameters that produce a feature group
+
+		Parameters
+		-----------
+			inputs : list
+				dataframes (hashed by content) and file paths (hashed by size and modified time)
+			code : list
+				functions or classes whose source goes into the hash
+			params : dict
+				any other arguments to the feature code
+
+		Returns
+		-----------
+			str
+				hex digest
+		"""
+		digest = hashlib.sha1()
+
+		for item in inputs:
+			if isinstance(item, pd.DataFrame):
+				digest.update(str(list(item.columns)).encode())
+				digest.update(pd.util.hash_pandas_object(item, index=True).to_numpy().tobytes())
+			elif os.path.isfile(item):
+				stat = os.stat(item)
+				digest.update((item + str(stat.st_size) + str(stat.st_mtime)).encode())
+			else:
+				digest.update(('missing:' + str(item)).encode())
+
+		for obj in code:
+			digest.update(inspect.getsource(obj).encode())
+
+		digest.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+
+		return digest.hexdigest()
+
+	def path(self, group, fingerprint):
+		return os.path.join(self.store_dir, group, fingerprint + '.parquet')
+
+	def get(self, group, compute, fingerprint):
+		"""
+		Load a feature group if a version with this fingerprint is stored, otherwise compute it and store it
+
+		Parameters
+		-----------
+			group : str
+				name of the feature group, eg 'rolling'
+			compute : function
+				called with no arguments to build the group if it isn't stored
+			fingerprint : str
+				from FeatureStore.fingerprint
+
+		Returns
+		-----------
+			pandas dataframe
+				the feature group
+		"""
+		path = self.path(group, fingerprint)
+
+		if os.path.isfile(path):
+			print("Loading stored feature group " + group + "...")
+			return pd.read_parquet(path)
+
+		print("Computing feature group " + group + "...")
+		features = compute()
+
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		features.to_parquet(path, index=True)
+
+		return features
 
 class FeatureEngineer(object):
 
-	def __init__(self,df):
+	#feature groups that can be materialized in a FeatureStore: group name -> (method, extra input files)
+	FEATURE_GROUPS = {
+		'lifetime': ('calc_lifetime_avg', []),
+		'rolling': ('calc_rolling_avg', []),
+		'ytd': ('calc_ytd_avgs', []),
+		'ewm': ('calc_ewm_avgs', []),
+		'rotoguru': ('rotoguru_features', ['roto_data_2015-2018.csv']),
+	}
+
+	#goes into every stored group's fingerprint - bump it when a change to shared feature code outside the hashed methods
+	#(helpers, key building, the crosswalk lookup...) changes what the groups contain
+	FEATURE_VERSION = 1
+
+	def __init__(self,df, crosswalk_filepath='player_crosswalk.sqlite', keys_filepath='surrogate_keys.json', keys=None):
+		self.crosswalk = PlayerCrosswalk(crosswalk_filepath)
+		#pass the DatabaseHelper's KeyService as keys to share one set of ids with it
+		self.keys = keys if keys is not None else KeyService(keys_filepath)
+
 		if len(df) == 0:
 			print("Need to pass a dataframe to engineer on initializing!")
 			return ""
 		#select only the numeric cols, excluding the year
-		self.num_cols = list(df.select_dtypes(include=np.number).drop('year', axis=1).columns.values)
+		self.num_cols = list(df.select_dtypes(include=np.number).drop(['year'] + [c for c in SURROGATE_KEY_COLS if c in df.columns], axis=1).columns.values)
 
 		#for calculating averages, we want a df sorted by player and date
 		self.avg_df = df.sort_values(['player', 'game_date'])
 
 		#we changed and are merging features on a different ID -create it here so it can be used by all functions
-		self.avg_df['roto_game_id'] = self.avg_df['game_date'] + self.avg_df['player']
+		self.avg_df['roto_game_id'] = self.avg_df['game_date'].astype(str) + self.avg_df['player'].astype(str)
+		#frames from DatabaseHelper already have their keys.  Only DatabaseHelper adds ids to the keys file, so here every player
+		#has to have one already (an in-memory KeyService has no file, it can hand out ids freely)
+		if 'roto_game_key' not in self.avg_df.columns:
+			self.avg_df['roto_game_key'] = self.keys.roto_game_key(self.avg_df['game_date'], self.avg_df['player'], add=self.keys.filepath is None)
+			if (self.avg_df['roto_game_key'] < 0).any():
+				unknown = self.avg_df.loc[self.avg_df['roto_game_key'] < 0, 'player'].unique()
+				raise ValueError("Players without an id in " + str(self.keys.filepath) + ", eg " + str(list(unknown[:5])) + \
+								 " - build the frame with DatabaseHelper or pass its keys")
 
 	def calc_lifetime_avg(self):
 
 		return_df = self.avg_df.copy()
 
-		new_cols = ['roto_game_id']
+		new_cols = ['roto_game_id', 'roto_game_key']
 
 		for col in self.num_cols:
 			if col != 'FD_points':
@@ -268,35 +1437,506 @@ class FeatureEngineer(object):
 		#we return just the game_id and the new columns created.  These can be merged with other features created before going to the model
 		return return_df[new_cols]
 
-	def calc_rolling_avg(self):
-
-		return_df = self.avg_df.copy()
+	def calc_rolling_avg(self, calendar_days=False):
+		'''
+		Rolling averages of every numeric column over each player's previous N games.  If calendar_days is true, the windows
+		are the previous N calendar days instead, so off days and injured list stints don't stretch them (see calc_calendar_avgs)
+		'''
+		if calendar_days:
+			return self.calc_calendar_avgs(include_sums=False)
 
 		#we need to figure out if these are pitching averages or batting averages - different timeframes are relevant
-		try:
-			return_df['IP']
+		if 'IP' in self.avg_df.columns:
 			avgs = [2,3,5,10,15]
-		except KeyError:
+		else:
 			#1-4 week and 6 week
 			avgs = [7,14,21,28,42]
 
-		new_cols = ['roto_game_id']
+		#every column and every window in one pass over the sorted panel.  the current game is never included in the average
+		panel = self.get_panel()
+		new_cols = [col + '_' + str(avg) + 'dayavg' for col in panel.cols for avg in avgs]
 
-		for col in self.num_cols:
-			if col != 'FD_points':
-				for avg in avgs:
+		return_df = pd.DataFrame(panel.rolling_means(avgs), columns=new_cols, index=panel.index)
+		return_df.insert(0, 'roto_game_id', self.avg_df['roto_game_id'])
+		return_df.insert(1, 'roto_game_key', self.avg_df['roto_game_key'])
 
-					newcol = col + '_' + str(avg) + 'dayavg'
+		#we return just the game_id and the new columns created.  These can be merged with other features created before going to the model
+		return return_df
 
-					#we group by player and date and calc expanded mean. we shift down by one to make sure no current day info is included
-					return_df[newcol] = return_df.sort_values(['player', 'game_date']).groupby(['player'])[col].rolling(avg,avg).mean().shift().values
-					#set the first value for each player to NaN since we wouldnt have data for it
-					return_df.loc[return_df.groupby(['player'])[newcol].head(1).index, newcol] = np.NaN
+	def calc_ewm_avgs(self, halflives=None, calendar_days=False):
+		"""
+		Exponentially weighted averages of every numeric column over each player's earlier games (col_Ngameewm, or
+		col_Ndayewm with calendar_days).  Recent games count the most and older ones fade out, so one or two of these can
+		stand in for the whole ladder of rolling windows
 
-					new_cols.append(newcol)
+		Parameters
+		-----------
+			halflives : list
+				half-lives in games (or days).  Defaults to a short and a long one for batters or pitchers
+			calendar_days : bool
+				if true, weights halve every N calendar days instead of every N games
 
-		#we return just the game_id and the new columns created.  These can be merged with other features created before going to the model
-		return return_df[new_cols]
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the new columns, aligned with avg_df
+		"""
+		pitching = 'IP' in self.avg_df.columns
+		if halflives is None:
+			if calendar_days:
+				halflives = [15,45] if pitching else [7,30]
+			else:
+				halflives = [2,5] if pitching else [5,20]
+
+		panel = self.get_panel()
+		unit = 'dayewm' if calendar_days else 'gameewm'
+		new_cols = [col + '_' + str(halflife) + unit for col in panel.cols for halflife in halflives]
+
+		return_df = pd.DataFrame(panel.ewm_means(halflives, calendar_days=calendar_days), columns=new_cols, index=panel.index)
+		return_df.insert(0, 'roto_game_id', self.avg_df['roto_game_id'])
+		return_df.insert(1, 'roto_game_key', self.avg_df['roto_game_key'])
+
+		return return_df
+
+	def calc_calendar_avgs(self, windows=None, include_sums=True):
+		"""
+		True N-day trailing features: for each game, the mean (col_Ndayavg), sum (col_Ndaysum) of every numeric column over
+		the games the player played in the N calendar days before it, plus the number of those games (games_Ndaycount).
+		Games earlier the same day are not included
+
+		Parameters
+		-----------
+			windows : list
+				window lengths in days.  Defaults to 1-4 and 6 weeks for batters, 10-75 days (roughly 2-15 starts) for pitchers
+			include_sums : bool
+				if false, only return the averages
+
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the new columns, aligned with avg_df
+		"""
+		if windows is None:
+			if 'IP' in self.avg_df.columns:
+				windows = [10,15,25,50,75]
+			else:
+				windows = [7,14,21,28,42]
+
+		panel = self.get_panel()
+
+		return_df = self.avg_df[['roto_game_id', 'roto_game_key']].copy()
+		features = {}
+		for days in windows:
+			sums, counts, means, games = panel.calendar_windows(days)
+
+			for i, col in enumerate(panel.cols):
+				features[col + '_' + str(days) + 'dayavg'] = means[:, i]
+				if include_sums:
+					features[col + '_' + str(days) + 'daysum'] = sums[:, i]
+
+			if include_sums:
+				features['games_' + str(days) + 'daycount'] = games
+
+		#order columns the same way as calc_rolling_avg - column by column, then window by window
+		order = [col + '_' + str(days) + 'dayavg' for col in panel.cols for days in windows]
+		if include_sums:
+			order += [col + '_' + str(days) + 'daysum' for col in panel.cols for days in windows]
+			order += ['games_' + str(days) + 'daycount' for days in windows]
+
+		return pd.concat([return_df, pd.DataFrame(features, index=panel.index)[order]], axis=1)
+
+	def feature_matrix(self, store, groups=None):
+		"""
+		Get feature groups from a FeatureStore, computing only the ones whose data or code changed, and line them up with avg_df
+
+		Parameters
+		-----------
+			store : FeatureStore
+				where feature groups are kept
+			groups : list
+				names from FEATURE_GROUPS.  All of them if not given
+
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the features of every group, one row per row of avg_df
+		"""
+		if groups is None:
+			groups = list(self.FEATURE_GROUPS.keys())
+
+		#hashing the base data is the slow part of the fingerprint, only do it once
+		if getattr(self, 'data_fingerprint', None) is None:
+			self.data_fingerprint = store.fingerprint(inputs=[self.avg_df])
+
+		batting = 'IP' not in self.avg_df.columns
+		frames = []
+
+		for group in groups:
+			method_name, input_files = self.FEATURE_GROUPS[group]
+			method = getattr(self, method_name)
+			kwargs = {'batting': batting} if group == 'rotoguru' else {}
+
+			#rotoguru rows are matched to players through the crosswalk, so the rows it joins on are an input too.  Not the
+			#crosswalk file itself - lookup writes to it, so its modified time changes on every build
+			if group == 'rotoguru':
+				input_files = input_files + [self.rotoguru_crosswalk(input_files[0])]
+
+			#__init__ picks the numeric columns and builds the keys, get_panel the panel most groups are computed from
+			code = [method, PlayerPanel, FeatureEngineer.__init__, FeatureEngineer.get_panel]
+			params = dict(kwargs, data=self.data_fingerprint, num_cols=self.num_cols, version=self.FEATURE_VERSION)
+			fingerprint = store.fingerprint(inputs=input_files, code=code, params=params)
+			features = store.get(group, lambda: method(**kwargs), fingerprint)
+
+			#rotoguru rows carry a game_number, so double header games line up with their own avg_df row
+			frames.append(features)
+
+		return self.assemble_features(frames)
+
+	def rotoguru_crosswalk(self, filepath='roto_data_2015-2018.csv'):
+		'''The crosswalk rows of the players in the rotoguru csv, resolving any new ones first the same way rotoguru_features does'''
+		try:
+			mlbam_ids = pd.read_csv(filepath, usecols=['MLB_ID'])['MLB_ID'].unique()
+		except FileNotFoundError:
+			mlbam_ids = []
+
+		return self.crosswalk.lookup(mlbam_ids).sort_values('key_mlbam').reset_index(drop=True)
+
+	def assemble_features(self, frames, base_cols=()):
+		"""
+		Build one feature matrix out of several feature groups, one row per row of avg_df, instead of chaining pd.merge.
+		Groups are lined up by their roto_game_key (or roto_game_id) column, see aligned_positions.  Each group is copied
+		once into a preallocated array, and keys have to be unique (or told apart by avg_df's index) so a join can never
+		add rows - a group with duplicate keys is an error rather than something to drop_duplicates afterwards
+
+		Parameters
+		-----------
+			frames : list
+				numeric feature dataframes, eg from calc_lifetime_avg, calc_rolling_avg, rotoguru_features
+			base_cols : list
+				columns of avg_df to add as well, eg ['FD_points']
+
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key, base_cols and every feature column, indexed and ordered like avg_df.  Rows a
+				group has no entry for are NaN
+		"""
+		if not self.avg_df.index.is_unique:
+			raise ValueError("The base dataframe's index has duplicates, reset it before building features")
+
+		names = list(base_cols)
+		blocks = [(np.arange(len(self.avg_df)), self.avg_df[list(base_cols)])]
+
+		for frame in frames:
+			feature_cols = [col for col in frame.columns if col not in SURROGATE_KEY_COLS + ['roto_game_id', 'game_number']]
+
+			non_numeric = [col for col in feature_cols if not pd.api.types.is_numeric_dtype(frame[col])]
+			if len(non_numeric) > 0:
+				raise ValueError("Feature columns have to be numeric: " + str(non_numeric))
+
+			repeated = set(feature_cols) & set(names)
+			if len(repeated) > 0:
+				raise ValueError("Feature columns are in more than one group: " + str(sorted(repeated)))
+
+			blocks.append((self.aligned_positions(frame), frame[feature_cols]))
+			names += feature_cols
+
+		#fill the matrix group by group - rows that aren't matched stay NaN
+		matrix = np.full((len(self.avg_df), len(names)), np.nan)
+		offset = 0
+		for positions, features in blocks:
+			found = positions >= 0
+			matrix[found, offset:offset + features.shape[1]] = features.to_numpy(dtype='float64')[positions[found]]
+			offset += features.shape[1]
+
+		return_df = pd.DataFrame(matrix, columns=names, index=self.avg_df.index)
+		return_df.insert(0, 'roto_game_id', self.avg_df['roto_game_id'])
+		return_df.insert(1, 'roto_game_key', self.avg_df['roto_game_key'])
+
+		return return_df
+
+	def aligned_positions(self, frame):
+		"""
+		Row position in frame that lines up with each row of avg_df, or -1 if frame has nothing for it
+
+		Parameters
+		-----------
+			frame : pandas dataframe
+				a feature group.  Matched on roto_game_key, or roto_game_id if there is no key column, and only on the
+				index if it has neither.  Double headers share a key: a frame with a game_number column is matched on
+				(roto_game_key, game_number) against game_numbers(), otherwise repeated keys are only accepted if the frame
+				kept avg_df's index - the (key, index) pairs then tell the games apart
+
+		Returns
+		-----------
+			numpy array
+				int positions, one per row of avg_df
+
+		Raises
+		-----------
+			ValueError
+				if frame has missing keys, or repeated keys that its index doesn't resolve
+		"""
+		if 'roto_game_key' in frame.columns:
+			on = 'roto_game_key'
+		elif 'roto_game_id' in frame.columns:
+			on = 'roto_game_id'
+		else:
+			if not frame.index.is_unique:
+				raise ValueError("Feature rows have no key columns and a duplicated index - they can't be lined up")
+			return frame.index.get_indexer(self.avg_df.index)
+
+		keys, base_keys = frame[on].to_numpy(), self.avg_df[on].to_numpy()
+		if pd.isnull(keys).any():
+			raise ValueError("Feature rows have " + str(pd.isnull(keys).sum()) + " missing " + on + " values")
+
+		if on == 'roto_game_key' and 'game_number' in frame.columns:
+			games = pd.MultiIndex.from_arrays([keys, frame['game_number'].to_numpy()])
+			if not games.is_unique:
+				dupes = games[games.duplicated()].unique()
+				raise ValueError("Feature rows have duplicate (roto_game_key, game_number) values, eg " + str(list(dupes[:5])) + " - a join would add rows")
+
+			return games.get_indexer(pd.MultiIndex.from_arrays([base_keys, self.game_numbers()]))
+
+		#groups built from the panel come back in avg_df's order - check the keys row by row and skip the lookup
+		if frame.index.equals(self.avg_df.index) and (keys == base_keys).all():
+			return np.arange(len(frame))
+
+		if pd.Index(keys).is_unique:
+			return pd.Index(keys).get_indexer(base_keys)
+
+		#repeated keys - only the index can tell which game is which, and every row has to find its game
+		pairs = pd.MultiIndex.from_arrays([keys, frame.index])
+		positions = pairs.get_indexer(pd.MultiIndex.from_arrays([base_keys, self.avg_df.index])) if pairs.is_unique else None
+		if positions is None or (positions >= 0).sum() != len(frame):
+			dupes = pd.Index(keys)[pd.Index(keys).duplicated()].unique()
+			raise ValueError("Feature rows have duplicate " + on + " values, eg " + str(list(dupes[:5])) + \
+							 ", and their index doesn't match the base dataframe's to tell them apart - a join would add rows")
+
+		return positions
+
+	def game_numbers(self):
+		'''Each avg_df row's game of the day for the player - 0, or 1 for the second game of a double header, by start time'''
+		if getattr(self, 'base_game_numbers', None) is None:
+			start_times = self.avg_df['start_time'] if 'start_time' in self.avg_df.columns else None
+			self.base_game_numbers = _game_numbers(self.avg_df['roto_game_key'], start_times)
+
+		return self.base_game_numbers
+
+	def plan_features(self, feature_names):
+		"""
+		Work out what has to be computed for a list of feature names, eg ['PA_14dayavg', 'RBI_ytdavg'].  Understands the names
+		made by calc_lifetime_avg (col_lifeavg), calc_ytd_avgs (col_ytdavg), calc_rolling_avg (col_Ndayavg),
+		calc_calendar_avgs (col_Ndaysum, games_Ndaycount) and calc_ewm_avgs (col_Ngameewm, col_Ndayewm).  Names that are
+		already columns of avg_df are passed through
+
+		Returns
+		-----------
+			dict
+				'cols' : the base columns needed
+				'lifetime', 'ytd' : columns needing those averages
+				'rolling', 'calendar_sum' : window -> columns needing it
+				'ewm_games', 'ewm_days' : half-life -> columns needing it
+				'calendar_count' : windows needing a game count
+				'passthrough' : names taken straight from avg_df
+		"""
+		plan = {'cols': [], 'lifetime': [], 'ytd': [], 'rolling': {}, 'calendar_sum': {}, 'calendar_count': [], 'ewm_games': {}, 'ewm_days': {}, 'passthrough': []}
+		unknown = []
+
+		for name in feature_names:
+			if name in self.avg_df.columns:
+				plan['passthrough'].append(name)
+				continue
+
+			count_match = re.match(r'^games_(\d+)daycount$', name)
+			window_match = re.match(r'^(.+)_(\d+)day(avg|sum)$', name)
+			ewm_match = re.match(r'^(.+)_(\d+)(game|day)ewm$', name)
+
+			if count_match:
+				plan['calendar_count'].append(int(count_match.group(1)))
+				continue
+			elif window_match:
+				col, window, kind = window_match.group(1), int(window_match.group(2)), window_match.group(3)
+				plan['rolling' if kind == 'avg' else 'calendar_sum'].setdefault(window, []).append(col)
+			elif ewm_match:
+				col, halflife, unit = ewm_match.group(1), int(ewm_match.group(2)), ewm_match.group(3)
+				plan['ewm_games' if unit == 'game' else 'ewm_days'].setdefault(halflife, []).append(col)
+			elif name.endswith('_lifeavg'):
+				col = name[:-len('_lifeavg')]
+				plan['lifetime'].append(col)
+			elif name.endswith('_ytdavg'):
+				col = name[:-len('_ytdavg')]
+				plan['ytd'].append(col)
+			else:
+				unknown.append(name)
+				continue
+
+			if col not in self.num_cols:
+				unknown.append(name)
+			elif col not in plan['cols']:
+				plan['cols'].append(col)
+
+		if len(unknown) > 0:
+			raise ValueError("Don't know how to compute features: " + str(unknown))
+
+		return plan
+
+	def calc_features(self, feature_names, calendar_days=False):
+		"""
+		Compute only the features asked for.  The base columns, windows and aggregations needed are worked out from the names
+		(see plan_features), so a model that uses ten features only pays for those ten
+
+		Parameters
+		-----------
+			feature_names : list
+				features to compute, eg CrossValidator.KNOWN_GOOD_BATTING_FEATURES
+			calendar_days : bool
+				if true, col_Ndayavg features are N calendar day averages instead of N game averages
+
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the requested features in the order asked for, aligned with avg_df
+		"""
+		plan = self.plan_features(feature_names)
+
+		#a panel of just the columns we need
+		panel = PlayerPanel(self.avg_df, plan['cols'])
+		position = {col: i for i, col in enumerate(panel.cols)}
+		features = {}
+
+		if len(plan['lifetime']) > 0:
+			means = panel.expanding_means()
+			for col in plan['lifetime']:
+				features[col + '_lifeavg'] = means[:, position[col]]
+
+		if len(plan['ytd']) > 0:
+			means = panel.ytd_means()
+			for col in plan['ytd']:
+				features[col + '_ytdavg'] = means[:, position[col]]
+
+		for window, cols in plan['rolling'].items():
+			if calendar_days:
+				means = panel.calendar_windows(window)[2]
+			else:
+				means = panel.rolling_means([window])
+			for col in cols:
+				features[col + '_' + str(window) + 'dayavg'] = means[:, position[col]]
+
+		for unit in ['game', 'day']:
+			halflives = list(plan['ewm_' + unit + 's'].keys())
+			if len(halflives) > 0:
+				means = panel.ewm_means(halflives, calendar_days=unit == 'day').reshape(len(panel.rows), len(panel.cols), len(halflives))
+				for j, halflife in enumerate(halflives):
+					for col in plan['ewm_' + unit + 's'][halflife]:
+						features[col + '_' + str(halflife) + unit + 'ewm'] = means[:, position[col], j]
+
+		for window in set(plan['calendar_sum'].keys()) | set(plan['calendar_count']):
+			sums, counts, means, games = panel.calendar_windows(window)
+			for col in plan['calendar_sum'].get(window, []):
+				features[col + '_' + str(window) + 'daysum'] = sums[:, position[col]]
+			features['games_' + str(window) + 'daycount'] = games
+
+		return_df = self.avg_df[['roto_game_id', 'roto_game_key']].copy()
+		for name in feature_names:
+			if name in ('roto_game_id', 'roto_game_key'):
+				continue
+			return_df[name] = self.avg_df[name] if name in plan['passthrough'] else features[name]
+
+		return return_df
+
+	def calc_features_parallel(self, groups=('lifetime', 'ytd', 'rolling'), n_jobs=None, batch_size=8):
+		"""
+		Compute whole feature groups across a pool of processes.  The sorted numeric columns, their prefix sums and the panel
+		bookkeeping are put in shared memory once; each task computes one group for a range of columns and writes straight
+		into a shared output array, so workers never copy the input and results need no merging
+
+		Parameters
+		-----------
+			groups : list
+				any of 'lifetime', 'ytd', 'rolling' (N game averages), 'calendar' (N calendar day averages) and 'ewm' (N game
+				half-life exponential averages).  'rolling' and 'calendar' produce the same column names, so only one of them
+				can be asked for
+			n_jobs : int
+				number of worker processes.  Defaults to the number of cores
+			batch_size : int
+				number of columns per task
+
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the features of every group, with the same names as the single process methods
+		"""
+		if 'rolling' in groups and 'calendar' in groups:
+			raise ValueError("'rolling' and 'calendar' make the same column names - ask for one of them")
+
+		panel = self.get_panel()
+		pitching = 'IP' in self.avg_df.columns
+		windows = {'rolling': [2,3,5,10,15] if pitching else [7,14,21,28,42], 'calendar': [10,15,25,50,75] if pitching else [7,14,21,28,42], \
+				'ewm': [2,5] if pitching else [5,20]}
+		suffixes = {'lifetime': ['_lifeavg'], 'ytd': ['_ytdavg'], 'ewm': ['_' + str(halflife) + 'gameewm' for halflife in windows['ewm']]}
+		for group in ['rolling', 'calendar']:
+			suffixes[group] = ['_' + str(days) + 'dayavg' for days in windows[group]]
+
+		#work out where every group/column batch goes in the output
+		names = []
+		tasks = []
+		for group in groups:
+			for lo in range(0, len(panel.cols), batch_size):
+				hi = min(lo + batch_size, len(panel.cols))
+				tasks.append({'group': group, 'lo': lo, 'hi': hi, 'cols': panel.cols[lo:hi], 'windows': windows.get(group), 'offset': len(names)})
+				names += [col + suffix for col in panel.cols[lo:hi] for suffix in suffixes[group]]
+
+		blocks = []
+		try:
+			shm, values_spec = _to_shared(panel.values)
+			blocks.append(shm)
+			shm, csum_spec = _to_shared(panel.csum)
+			blocks.append(shm)
+			shm, ccount_spec = _to_shared(panel.ccount)
+			blocks.append(shm)
+
+			layout_spec = {}
+			for name, values in panel.layout().items():
+				shm, layout_spec[name] = _to_shared(values)
+				blocks.append(shm)
+
+			shm, out_spec = _to_shared(np.full((len(panel.rows), len(names)), np.nan))
+			blocks.append(shm)
+
+			for task in tasks:
+				task.update({'values': values_spec, 'csum': csum_spec, 'ccount': ccount_spec, 'layout': layout_spec, 'out': out_spec})
+
+			with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+				self.parallel_timings = list(pool.map(_feature_task, tasks))
+
+			out = np.ndarray(out_spec[1], dtype=out_spec[2], buffer=blocks[-1].buf)
+			return_df = pd.DataFrame(out.copy(), columns=names, index=panel.index)
+			del out
+		finally:
+			for shm in blocks:
+				shm.close()
+				shm.unlink()
+
+		return_df.insert(0, 'roto_game_id', self.avg_df['roto_game_id'])
+		return_df.insert(1, 'roto_game_key', self.avg_df['roto_game_key'])
+
+		return return_df
+
+	def online_state(self):
+		'''
+		Build an OnlineFeatureState from this engineer's data, to update lifetime, ytd and rolling averages one day at a time
+		'''
+		windows = [2,3,5,10,15] if 'IP' in self.avg_df.columns else [7,14,21,28,42]
+
+		return OnlineFeatureState.from_history(self.avg_df, cols=self.get_panel().cols, windows=windows)
+
+	def get_panel(self):
+		'''Build the PlayerPanel of the numeric feature columns the first time it is needed'''
+		if getattr(self, 'panel', None) is None:
+			self.panel = PlayerPanel(self.avg_df, [col for col in self.num_cols if col != 'FD_points'])
+
+		return self.panel
 
 	def calc_ytd_avgs(self):
 
@@ -305,7 +1945,7 @@ class FeatureEngineer(object):
 		#since it's YTD, we want to make sure we sort by year as well
 		return_df = return_df.sort_values(['player', 'year', 'game_date'])
 
-		new_cols = ['roto_game_id']
+		new_cols = ['roto_game_id', 'roto_game_key']
 
 		for col in self.num_cols:
 			if col != 'FD_points':
@@ -321,77 +1961,107 @@ class FeatureEngineer(object):
 		#we return just the game_id and the new columns created.  These can be merged with other features created before going to the model
 		return return_df[new_cols]
 
-	# For the first time, include the path to the statcast cache, follow on running can include preload=True
-	def stadium_batter_avg(self, switch_cutoff=0.05, preload=False, filepath_statcast_cache = '../statcast_cache.csv'):
-
-		batting_df = self.avg_df.copy()
+	def stadium_batter_avg(self, switch_cutoff=0.05, preload=None, db_helper=None, start_date="", end_date="", filepath_hand_index='batter_hand_counts.csv'):
+		"""
+		Average batting average in each stadium for left handed, right handed and switch hitters
 
-		batting_column = 'batting_hand_' + str(switch_cutoff)
+		Parameters
+		-----------
+			switch_cutoff : float
+				a batter is a switch hitter if they batted from their less used side for at least this share of the pitches
+				from their main side
+			preload : bool
+				True to use the stored handedness counts as they are, False to add the pitch data between start_date and
+				end_date to them first.  By default the pitch data is only read if there are no stored counts yet
+			db_helper : DatabaseHelper
+				pointing at the sqlite file with the pitch data.  Only needed when the counts are updated
+			start_date, end_date : str
+				dates of pitch data to count, 'YYYY-MM-DD'.  Everything if not given
+			filepath_hand_index : str
+				where the handedness counts are stored (see HandednessIndex)
 
-		if not preload:
-			try:
-				statcast_frame_raw = pd.read_csv(filepath_statcast_cache)
-			except:
-				print("Could not locate statcast_cache.csv, please check filepath_statcast_cache value")
+		Returns
+		-----------
+			pandas dataframe
+				game_id, roto_game_id, roto_game_key and stadium_batting_avg_<switch_cutoff>, aligned with avg_df
+		"""
+		hand_index = HandednessIndex(filepath_hand_index)
+
+		if preload is False or (preload is None and len(hand_index.counts) == 0):
+			if db_helper is None:
+				print("Need a DatabaseHelper with the pitch data to count pitches by batting side, please pass db_helper")
 				return ""
 
-			left_right_hand = statcast_frame_raw.groupby(['batter', 'stand']).size()
-
-			left_right_hand = left_right_hand.reset_index()
-			left_right_hand.rename(columns={0:"bat_count"}, inplace=True)
-
-			# Convert to long format with columns titled L / R (Left or Right handed pitches received)
-			lr_pivot = left_right_hand.pivot(columns='stand', index="batter", values='bat_count')
-			lr_pivot = lr_pivot.reset_index()
-			lr_pivot = lr_pivot.fillna(0)
-
-			# Creates helpyer columns to calculate how many pitches each player received
-			# for each hand, and calculate the % of switch hitting each engaged in
-			lr_pivot['primary_hand'] = np.where(lr_pivot['L'] > lr_pivot['R'], 'L', 'R')
-			lr_pivot['major_count'] = np.where(lr_pivot['L'] > lr_pivot['R'], lr_pivot['L'], lr_pivot['R'])
-			lr_pivot['minor_count'] = np.where(lr_pivot['L'] > lr_pivot['R'], lr_pivot['R'], lr_pivot['L'])
-			lr_pivot['switch_perc'] = (lr_pivot['minor_count'] / lr_pivot['major_count'])
-			lr_pivot = lr_pivot.replace(np.inf, np.nan).fillna(0)
-
-			# if a player performs more than 5% of their bats using the other hand, they're classified as a switch hitter
-			lr_pivot[batting_column] = np.where(lr_pivot['switch_perc'] < switch_cutoff, lr_pivot['primary_hand'], "S")
-
-			lr_pivot.sort_values(by='switch_perc', ascending=False)
+			print("Counting pitches by batting side in " + db_helper.filepath + "...")
+			hand_index.update_from_database(db_helper, start_date, end_date)
+			hand_index.save()
 
-			left_right = lr_pivot[['batter', batting_column]]
+		# Batting hand for this cutoff, straight from the stored L/R counts
+		left_right = hand_index.hands(switch_cutoff)
 
-			# Lookup 'batter keys' to mlb keys
-			player_list = left_right['batter'].tolist()
+		# Lookup 'batter keys' (mlbam) to bbref keys
+		player_id_values = self.crosswalk.lookup(left_right['batter'].tolist())
+		left_right = left_right.merge(player_id_values[['key_mlbam', 'key_bbref']], how='inner', left_on='batter', right_on='key_mlbam')
+		batting_hand = self.avg_df['player'].map(left_right.drop_duplicates('key_bbref').set_index('key_bbref')['batting_hand'])
 
-			# Lookup keys to get each player's various keys (mlb, bbref, etc.)
-			player_id_values = playerid_reverse_lookup(player_list, key_type='mlbam')
+		# Average by stadium and batting hand.  Possible future expansion here based on date, maybe not tho
+		new_col = 'stadium_batting_avg_' + str(switch_cutoff)
+		return_frame = self.avg_df[[col for col in ['game_id', 'roto_game_id', 'roto_game_key'] if col in self.avg_df.columns]].copy()
+		return_frame[new_col] = self.avg_df.groupby([self.avg_df['stadium'], batting_hand])['batting_avg'].transform('mean')
 
-			# Merge player keys to batter df based on key
-			cols_to_merge = ['name_last', 'name_first', 'key_mlbam', 'key_bbref', 'key_fangraphs', 'key_retro']
-			left_right_with_keys = left_right.merge(player_id_values[cols_to_merge], how='inner', left_on='batter', right_on='key_mlbam')
-
-			# Cache
-			print('Creating cache "batter_hand.csv" in current directory...')
-			left_right_with_keys.to_csv('batter_hand.csv', index=False)
-
-		# Load the cache
-		left_right = pd.read_csv('batter_hand.csv')
-
-		batting_df2 = batting_df.merge(left_right[[batting_column, 'key_bbref']], how="left", left_on="player", right_on="key_bbref")
-		batting_df2.drop('key_bbref', 1, inplace=True)
-
-		# Grouyp by stadium and batting hand.  Possible future expansion here based on date, maybe not tho
-		stadium_hand_averages = batting_df2.groupby(['stadium', batting_column])['batting_avg'].mean()
-		stadium_hand_averages = stadium_hand_averages.reset_index()
-
-		stadium_hand_averages.rename({"batting_avg": 'stadium_batting_avg_' + str(switch_cutoff) }, axis=1, inplace=True)
+		return return_frame
 
-		# Bring in the stadium averages to our normal DF (so we link back up with game_id)
-		batting_df3 = batting_df2.merge(stadium_hand_averages, how="left", left_on=["stadium", batting_column], right_on=["stadium", batting_column])
+	def matchup_history(self, db_helper, start_date="", end_date="", table_name='pitch_data'):
+		"""
+		Each batter's history against the starting pitcher they faced, from the statcast pitch data: plate appearances,
+		at bats, hits, batting average, slugging, on base percentage and strikeout rate in all their earlier games against
+		that pitcher (never the same day)
 
-		return_frame = batting_df3[[ 'game_id', 'stadium_batting_avg_' + str(switch_cutoff) ]]
+		Parameters
+		-----------
+			db_helper : DatabaseHelper
+				pointing at the sqlite file with the pitch data
+			start_date, end_date : str
+				dates of pitch data to use, 'YYYY-MM-DD'.  Everything if not given
+			table_name : str
+				the pitch data table
 
-		return return_frame
+		Returns
+		-----------
+			pandas dataframe
+				roto_game_id, roto_game_key and the <stat>_matchup_hist columns, aligned with avg_df.  NaN for games that
+				aren't in the pitch data
+		"""
+		matchups = db_helper.pull_matchup_events(start_date, end_date, table_name=table_name)
+		if matchups is None:
+			return
+
+		history = MatchupHistory(matchups)
+		games = MatchupHistory.starting_pitchers(matchups)
+
+		#match statcast batters up with our bbref players
+		lookup = self.crosswalk.lookup(games['batter'].unique())
+		games['player'] = games['batter'].map(lookup.drop_duplicates('key_mlbam').set_index('key_mlbam')['key_bbref'])
+		games = games[games['player'].isin(self.avg_df['player'])]
+
+		#double headers share a roto_game_key, so number each player's games within the day in the order they were played -
+		#by first pitch, since a made up game keeps its original (lower) game_pk even when it is played second
+		games['roto_game_key'] = self.keys.roto_game_key(games['game_date'], games['player'], add=False)
+		games = games.sort_values(['roto_game_key', 'first_pitch', 'game_pk'], na_position='last', kind='stable')
+		games['game_number'] = games.groupby('roto_game_key').cumcount()
+
+		#if statcast and avg_df don't have the same number of games for the player that day there is no telling which game
+		#is which, so those rows are left NaN rather than guessed
+		statcast_games = games.groupby('roto_game_key')['game_number'].transform('size').to_numpy()
+		base_games = games['roto_game_key'].map(self.avg_df['roto_game_key'].value_counts()).to_numpy()
+		games = games[statcast_games == base_games]
+
+		#each game gets the history before that day against its own starter, lined up by (roto_game_key, game_number)
+		features = history.features(games['batter'], games['pitcher'], games['game_date'])
+		features['roto_game_key'] = games['roto_game_key'].to_numpy()
+		features['game_number'] = games['game_number'].to_numpy()
+
+		return self.assemble_features([features])
 
 	def stadium_dummies(self):
 
@@ -450,7 +2120,7 @@ class FeatureEngineer(object):
 		#match rotoguru to baseball reference with different keys
 		print("Getting bbref key to merge rotoguru and bbref data")
 		unique_players = list(rotoguru['MLB_ID'].unique())
-		lookup = playerid_reverse_lookup(unique_players)
+		lookup = self.crosswalk.lookup(unique_players)
 
 		rotoguru = pd.merge(rotoguru, lookup[['key_mlbam', 'key_bbref']], left_on='MLB_ID', right_on='key_mlbam')
 
@@ -460,13 +2130,20 @@ class FeatureEngineer(object):
 		rotoguru.drop('Date', axis=1, inplace=True)
 
 		print("Merging bbref and rotoguru data to get FD scores")
+		#players without a bbref key can't match any bbref rows, so drop them before building keys
+		rotoguru = rotoguru[rotoguru['key_bbref'].notnull()]
 		#create a unique id to merge rotoguru and bbref data
 		rotoguru['roto_game_id'] = rotoguru['game_date'] + rotoguru['key_bbref']
+		#players we have no bbref rows for can't match avg_df, so they don't need (or get) an id
+		rotoguru['roto_game_key'] = self.keys.roto_game_key(rotoguru['game_date'], rotoguru['key_bbref'], add=False)
+		rotoguru = rotoguru[rotoguru['roto_game_key'] >= 0]
+		#rotoguru has a row per game on double header days - the start time says which game each one is
+		rotoguru['game_number'] = _game_numbers(rotoguru['roto_game_key'], rotoguru['Gametime_ET'])
 
 		if batting:
 			#there are only certain relevant columns we want to keep
 			batter_cols = ['Condition', 'Hand', 'FD_points', 'FD_salary', 'Gametime_ET', 'Home_Ump', 'H/A', 'Oppt', 'Oppt_pitch_Name', 'Oppt_pitch_MLB_ID', 'Oppt_pitch_hand', 'Order', 'Pos', 'Temp', \
-			               'W_dir', 'W_speed', 'roto_game_id']
+			               'W_dir', 'W_speed', 'roto_game_id', 'roto_game_key', 'game_number']
 
 			batters = rotoguru[rotoguru['Pos'] != 'P']
 			batters = batters[batter_cols]
@@ -478,11 +2155,13 @@ class FeatureEngineer(object):
 			batters_ohe.drop(['H/A_a', 'Condition_nan', 'W_dir_nan', 'Order_nan'], axis=1, inplace=True)
 			#add in relevant game_id
 			batters_ohe['roto_game_id'] = batters['roto_game_id']
+			batters_ohe['roto_game_key'] = batters['roto_game_key']
+			batters_ohe['game_number'] = batters['game_number']
 
 			return batters_ohe
 		else: #return pitching df instead
 			pitcher_cols = ['Condition', 'FD_points', 'FD_salary', 'Gametime_ET', 'Home_Ump', 'IP', 'H/A', 'Oppt', 'Oppt_pitch_Name', 'Oppt_pitch_MLB_ID', 'Oppt_pitch_hand', 'QS', 'Temp', \
-			               'W_dir', 'W_speed', 'roto_game_id']
+			               'W_dir', 'W_speed', 'roto_game_id', 'roto_game_key', 'game_number']
 
 			pitchers = rotoguru[rotoguru['Pos'] == 'P']
 			pitchers = pitchers[pitcher_cols]
@@ -492,6 +2171,8 @@ class FeatureEngineer(object):
 			pitchers_ohe.drop(['H/A_a', 'Condition_nan', 'W_dir_nan'], axis=1, inplace=True)
 
 			pitchers_ohe['roto_game_id'] = pitchers['roto_game_id']
+			pitchers_ohe['roto_game_key'] = pitchers['roto_game_key']
+			pitchers_ohe['game_number'] = pitchers['game_number']
 
 			return pitchers_ohe
 
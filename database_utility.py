@@ -1,17 +1,713 @@
 import sqlite3
 import pandas as pd
 import numpy as np
+import contextlib
 import datetime
-import math
+import json
+import os
+import shutil
+
+try:
+	import fcntl
+except ImportError:
+	#no advisory file locks on windows - KeyService writers aren't serialized there
+	fcntl = None
 
 from pybaseball import playerid_reverse_lookup
 
+import fantasy_scoring
+
+#number of rows fetched from sqlite at a time when streaming pitch data
+STATCAST_CHUNKSIZE = 250000
+
+#columns we index in the pitch table so date range and per player pulls are index seeks
+STATCAST_INDEX_COLS = ['game_date', 'batter', 'pitcher']
+
+#leftover columns from the raw statcast scrape that we never want
+STATCAST_DROP_COLS = ['index', '<html>']
+
+#compact types for the statcast columns we use most.  Everything else comes back as sqlite gives it to us
+STATCAST_DTYPES = {
+	'batter': 'int64',
+	'pitcher': 'int64',
+	'game_pk': 'int64',
+	'at_bat_number': 'int16',
+	'pitch_number': 'int16',
+	'inning': 'int8',
+	'balls': 'int8',
+	'strikes': 'int8',
+	'outs_when_up': 'int8',
+	'release_speed': 'float32',
+	'release_spin_rate': 'float32',
+	'launch_speed': 'float32',
+	'launch_angle': 'float32',
+	'hit_distance_sc': 'float32',
+	'estimated_ba_using_speedangle': 'float32',
+	'estimated_woba_using_speedangle': 'float32',
+	'woba_value': 'float32',
+}
+
+#game information keys on every scraped bbref box score.  the rest of the row comes from the player stat dicts
+BBREF_META_COLS = ['away_team', 'home_team', 'game_date', 'location', 'start_time', 'attendance', 'game_situation']
+
+#scraped stats that are kept as text instead of being parsed to numbers
+BATTING_TEXT_STATS = ['PO', 'A', 'details', 'position']
+PITCHING_TEXT_STATS = ['position']
+
+#ids kept for each player in the crosswalk, same names as pybaseball's playerid_reverse_lookup
+CROSSWALK_COLS = ['key_mlbam', 'key_bbref', 'key_fangraphs', 'key_retro', 'name_last', 'name_first']
+
+#ids pybaseball couldn't resolve are asked for again once their last check is this many days old - new players show up
+#in the Chadwick register a while after their debut
+CROSSWALK_RETRY_DAYS = 7
+
+#string columns with fewer unique values than this fraction of rows are stored as categoricals by compact_schema
+COMPACT_CATEGORY_RATIO = 0.5
+
+#integer key columns added by KeyService.  they are ids, not stats, so feature engineering skips them
+SURROGATE_KEY_COLS = ['roto_game_key', 'game_key']
+
+#bits each KeyService vocabulary gets in the packed game keys - more ids than this would spill into the next field
+KEY_BITS = {'player': 24, 'stadium': 8}
+
+#statcast events that score FanDuel batting points
+FD_BATTING_EVENTS = ['single', 'double', 'triple', 'walk', 'hit_by_pitch', 'home_run']
+
+#box score and statcast counting stats compact_schema may store as int16.  Only these - a rate or price column that happens
+#to be whole numbers in one pull shouldn't change type in the next
+COMPACT_COUNT_COLS = ['AB', 'R', 'H', 'RBI', 'BB', 'SO', 'PA', 'HR', 'ER', 'BF', 'Pit', 'Str', 'Ctct', 'StS', 'StL', 'GB', 'FB', 'LD', \
+					'Unk', 'IR', 'IS'] + FD_BATTING_EVENTS
+
+#statcast events that end a plate appearance but don't count as an at bat
+STATCAST_NON_AB_EVENTS = ['walk', 'intent_walk', 'hit_by_pitch', 'sac_fly', 'sac_fly_double_play', 'sac_bunt', 'sac_bunt_double_play', 'catcher_interf']
+
+#statcast events on the last pitch of an inning that aren't the batter's plate appearance (baserunning outs and the like)
+STATCAST_NON_PA_EVENTS = ['caught_stealing_2b', 'caught_stealing_3b', 'caught_stealing_home', 'pickoff_1b', 'pickoff_2b', 'pickoff_3b', \
+						'pickoff_caught_stealing_2b', 'pickoff_caught_stealing_3b', 'pickoff_caught_stealing_home', 'stolen_base_2b', \
+						'stolen_base_3b', 'stolen_base_home', 'wild_pitch', 'passed_ball', 'other_advance', 'runner_double_play', 'game_advisory']
+
+class BoxScoreFlattener(object):
+	'''
+	Flattens the player stat dictionaries scraped from bbref box scores into columns, one row per player per game.
+
+	Columns are buffers keyed by stat name that are allocated up front and grown by doubling, so adding a player is a
+	handful of array writes.  Stats are parsed to float as they come in, except the ones named in text_stats.
+	A stat that first shows up part way through gets a column backfilled with NaN.
+	'''
+	def __init__(self, text_stats=(), capacity=65536):
+		self.text_stats = set(text_stats)
+		self.capacity = capacity
+		self.num_rows = 0
+
+		#meta info columns first, then stats in the order we first see them
+		self.columns = {}
+		self.column_order = []
+		for col in BBREF_META_COLS + ['player', 'team']:
+			self._add_column(col, text=True)
+
+	def _add_column(self, name, text):
+		if text:
+			self.columns[name] = np.full(self.capacity, None, dtype=object)
+		else:
+			self.columns[name] = np.full(self.capacity, np.nan, dtype='float64')
+		self.column_order.append(name)
+
+	def _grow(self):
+		self.capacity *= 2
+		for name, buf in self.columns.items():
+			new_buf = np.full(self.capacity, None if buf.dtype == object else np.nan, dtype=buf.dtype)
+			new_buf[:self.num_rows] = buf[:self.num_rows]
+			self.columns[name] = new_buf
+
+	def add_players(self, meta_info, team, player_stats):
+		"""
+		Add a row for every player in one side of a box score
+
+		Parameters
+		----------
+		meta_info : list
+			game information values, in the order of BBREF_META_COLS
+		team : str
+			'away' or 'home'
+		player_stats : dict
+			player id -> {stat_name: value} as scraped
+		"""
+		meta_cols = BBREF_META_COLS
+		for player, stats in player_stats.items():
+			if self.num_rows == self.capacity:
+				self._grow()
+
+			i = self.num_rows
+			for col, value in zip(meta_cols, meta_info):
+				self.columns[col][i] = value
+			self.columns['player'][i] = player
+			self.columns['team'][i] = team
+
+			for stat, value in stats.items():
+				buf = self.columns.get(stat)
+				if buf is None:
+					self._add_column(stat, text=stat in self.text_stats)
+					buf = self.columns[stat]
+
+				if buf.dtype == object:
+					buf[i] = value
+				else:
+					buf[i] = _to_float(value)
+
+			self.num_rows += 1
+
+	def to_frame(self):
+		'''Return the rows added so far as a dataframe'''
+		return pd.DataFrame({col: self.columns[col][:self.num_rows] for col in self.column_order}, columns=self.column_order)
+
+def _to_float(value):
+	#same as pd.to_numeric(errors='coerce') on a single scraped value
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return np.nan
+
+class FrameCache(object):
+	'''
+	On-disk cache for the intermediate frames (bbref batting/pitching frames, raw statcast pulls).  Frames are written as
+	parquet partitioned by season and month, with the dtypes recorded next to the data so they come back already typed.
+	Reads only touch the columns and months asked for.
+	'''
+	def __init__(self, cache_dir='frame_cache'):
+		self.cache_dir = cache_dir
+
+	def path(self, name):
+		return os.path.join(self.cache_dir, name)
+
+	def schema_path(self, name):
+		return os.path.join(self.cache_dir, name + '_schema.json')
+
+	def exists(self, name):
+		return os.path.isdir(self.path(name)) and os.path.isfile(self.schema_path(name))
+
+	def write(self, df, name, date_col='game_date'):
+		"""
+		Write a frame to the cache, replacing anything already stored under the same name
+
+		Parameters
+		----------
+		df : dataframe
+			frame to store.  date_col is converted to a datetime if it isn't one already
+		name : str
+			name of the cached frame, eg 'batting_df_master'
+		date_col : str
+			date column used to build the season/month partitions
+		"""
+		df = self._with_partitions(df, date_col)
+
+		if os.path.isdir(self.path(name)):
+			shutil.rmtree(self.path(name))
+		os.makedirs(self.cache_dir, exist_ok=True)
+
+		df.to_parquet(self.path(name), partition_cols=['season', 'month'], index=False)
+
+		schema = {'date_col': date_col, 'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}}
+		with open(self.schema_path(name), 'w') as f:
+			json.dump(schema, f, indent=1)
+
+	def append(self, df, name):
+		"""
+		Add rows to a cached frame without rewriting what is already stored.  The rows are lined up with the stored
+		schema - missing columns are filled with NaN, extra columns are dropped.  Writes a new frame if nothing is cached yet
+		"""
+		if not self.exists(name):
+			return self.write(df, name)
+
+		with open(self.schema_path(name)) as f:
+			schema = json.load(f)
+
+		df = self._with_partitions(df, schema['date_col'])
+		df = df.reindex(columns=list(schema['dtypes'].keys()))
+
+		#int and bool columns can't hold the NaN of missing stats - switch those to the nullable version of the type.  parquet
+		#stores both the same way, so the partitions already written still read back fine
+		widened = False
+		for col, dtype in schema['dtypes'].items():
+			if (dtype.startswith('int') or dtype.startswith('uint') or dtype == 'bool') and df[col].isnull().any():
+				if dtype == 'bool':
+					schema['dtypes'][col] = 'boolean'
+				else:
+					schema['dtypes'][col] = 'UInt' + dtype[4:] if dtype.startswith('uint') else 'Int' + dtype[3:]
+				widened = True
+
+		df = df.astype(schema['dtypes'])
+
+		if widened:
+			with open(self.schema_path(name), 'w') as f:
+				json.dump(schema, f, indent=1)
+
+		#new files get unique names, so this only adds to the partitions
+		df.to_parquet(self.path(name), partition_cols=['season', 'month'], index=False)
+
+	def _with_partitions(self, df, date_col):
+		dates = pd.to_datetime(df[date_col])
+
+		#partition columns are added on a shallow copy so the caller's frame is left alone
+		df = df.assign(**{date_col: dates, 'season': dates.dt.year.astype('int16'), 'month': dates.dt.month.astype('int8')})
+		return df.reset_index(drop=True)
+
+	def read(self, name, columns=None, start_date=None, end_date=None):
+		"""
+		Load a cached frame, only reading the columns and date range asked for
+
+		Parameters
+		----------
+		name : str
+			name the frame was written under
+		columns : list
+			columns to load.  Loads every column if not given
+		start_date : str
+			first date to load in format 'YYYY-MM-DD'.  No lower bound if not given
+		end_date : str
+			last date to load in format 'YYYY-MM-DD'.  No upper bound if not given
+
+		Returns
+		----------
+		dataframe
+			the cached frame with the dtypes it was written with
+		"""
+		if not self.exists(name):
+			raise FileNotFoundError("No cached frame called " + name + " in " + self.cache_dir)
+
+		with open(self.schema_path(name)) as f:
+			schema = json.load(f)
+		date_col = schema['date_col']
+
+		#season and month filters prune whole partitions, the date filters then trim rows inside the edge months.  filters
+		#are a list of alternatives (OR) that each hold a list of conditions (AND)
+		filters = [[]]
+		if start_date:
+			start = pd.Timestamp(start_date)
+			after_start = [[('season', '>', start.year)], [('season', '==', start.year), ('month', '>=', start.month)]]
+			filters = [f + bound + [(date_col, '>=', start)] for f in filters for bound in after_start]
+		if end_date:
+			end = pd.Timestamp(end_date)
+			before_end = [[('season', '<', end.year)], [('season', '==', end.year), ('month', '<=', end.month)]]
+			filters = [f + bound + [(date_col, '<=', end)] for f in filters for bound in before_end]
+
+		df = pd.read_parquet(self.path(name), columns=columns, filters=filters if len(filters[0]) > 0 else None)
+
+		#partition columns only come back if they were asked for
+		if columns is None:
+			df = df.drop(['season', 'month'], axis=1)
+		else:
+			df = df[columns]
+
+		for col in df.columns:
+			dtype = schema['dtypes'].get(col)
+			if dtype is not None and str(df[col].dtype) != dtype:
+				df[col] = df[col].astype(dtype)
+
+		return df
+
+class PlayerCrosswalk(object):
+	'''
+	Local MLBAM <-> bbref <-> fangraphs <-> retrosheet id lookup, stored in a sqlite table indexed on the mlbam and bbref keys.
+
+	Ids we haven't seen are resolved with pybaseball's playerid_reverse_lookup once and stored.  Ids it can't resolve are
+	stored too, with the time they were checked, and only asked for again once that check is CROSSWALK_RETRY_DAYS old.
+	Everything else is a local query, so the pipeline runs without network access.
+	'''
+	def __init__(self, filepath='player_crosswalk.sqlite', table_name='player_crosswalk'):
+		self.filepath = filepath
+		self.table_name = table_name
+
+	def _connect(self):
+		conn = sqlite3.connect(self.filepath)
+		conn.execute('''CREATE TABLE IF NOT EXISTS {tn} (
+			key_mlbam INTEGER PRIMARY KEY,
+			key_bbref TEXT,
+			key_fangraphs INTEGER,
+			key_retro TEXT,
+			name_last TEXT,
+			name_first TEXT,
+			resolved INTEGER NOT NULL,
+			checked_at TEXT)'''.format(tn=self.table_name))
+		conn.execute('CREATE INDEX IF NOT EXISTS idx_{tn}_key_bbref ON {tn} (key_bbref)'.format(tn=self.table_name))
+		return conn
+
+	def _with_ids(self, conn, mlbam_ids):
+		#load the ids into a temp table so lookups are a single indexed join instead of a huge IN (...)
+		conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted_ids (key_mlbam INTEGER PRIMARY KEY)')
+		conn.execute('DELETE FROM wanted_ids')
+		conn.executemany('INSERT OR IGNORE INTO wanted_ids VALUES (?)', [(i,) for i in mlbam_ids])
+
+	def lookup(self, mlbam_ids, refresh=True):
+		"""
+		Get the crosswalk rows for a list of MLBAM ids
+
+		Parameters
+		----------
+		mlbam_ids : list
+			MLBAM player ids, duplicates are fine
+		refresh : bool
+			if true, resolve any ids not in the store yet with pybaseball first.  Set to false to never touch the network
+
+		Returns
+		----------
+		dataframe
+			one row per resolved id with columns key_mlbam, key_bbref, key_fangraphs, key_retro, name_last, name_first
+		"""
+		mlbam_ids = _clean_ids(mlbam_ids)
+
+		if refresh:
+			self.refresh(mlbam_ids)
+
+		conn = self._connect()
+		self._with_ids(conn, mlbam_ids)
+		lookup = pd.read_sql_query('''SELECT {cols} FROM {tn} JOIN wanted_ids USING (key_mlbam)
+			WHERE resolved = 1'''.format(cols=', '.join(CROSSWALK_COLS), tn=self.table_name), conn)
+		conn.close()
+
+		return lookup
+
+	def refresh(self, mlbam_ids, retry_days=CROSSWALK_RETRY_DAYS):
+		"""
+		Resolve and store any ids that aren't in the crosswalk yet, and retry the ones pybaseball couldn't resolve when
+		they were last checked more than retry_days ago.  Resolved ids are never looked up again
+
+		Returns
+		----------
+		int
+			number of ids that were looked up
+		"""
+		mlbam_ids = _clean_ids(mlbam_ids)
+		stale = (datetime.datetime.now() - datetime.timedelta(days=retry_days)).isoformat()
+
+		conn = self._connect()
+		self._with_ids(conn, mlbam_ids)
+		unseen = [row[0] for row in conn.execute('''SELECT w.key_mlbam FROM wanted_ids w
+			LEFT JOIN {tn} c ON c.key_mlbam = w.key_mlbam
+			WHERE c.key_mlbam IS NULL OR (c.resolved = 0 AND (c.checked_at IS NULL OR c.checked_at <= ?))'''.format(tn=self.table_name), (stale,))]
+		conn.close()
+
+		if len(unseen) == 0:
+			return 0
+
+		print("Looking up " + str(len(unseen)) + " new or unresolved player ids...")
+		try:
+			found = playerid_reverse_lookup(unseen, key_type='mlbam')
+		except (OSError, ValueError) as e:
+			#network errors (requests' exceptions are OSErrors) or a register download we couldn't parse - nothing is
+			#marked as checked, so these ids are tried again next time
+			print("Couldn't look up player ids, using the local crosswalk only: " + type(e).__name__ + ": " + str(e))
+			return 0
+
+		self.import_frame(found)
+
+		#remember the ids pybaseball couldn't resolve, and when, so we only ask again once the check is stale
+		missing = set(unseen) - set(_clean_ids(found['key_mlbam']))
+		checked_at = datetime.datetime.now().isoformat()
+		conn = self._connect()
+		conn.executemany('INSERT OR REPLACE INTO {tn} (key_mlbam, resolved, checked_at) VALUES (?, 0, ?)'.format(tn=self.table_name), \
+						 [(i, checked_at) for i in missing])
+		conn.commit()
+		conn.close()
+
+		return len(unseen)
+
+	def import_frame(self, lookup_df):
+		'''
+		Store rows from a playerid_reverse_lookup style dataframe (eg an old player_lookup.csv), replacing existing rows for the same ids
+		'''
+		lookup_df = lookup_df.dropna(subset=['key_mlbam'])
+		rows = lookup_df[CROSSWALK_COLS].astype(object).where(lookup_df[CROSSWALK_COLS].notnull(), None)
+
+		checked_at = datetime.datetime.now().isoformat()
+		records = []
+		for values in rows.itertuples(index=False):
+			values = list(values)
+			values[0] = int(values[0])
+			if values[2] is not None:
+				values[2] = int(values[2])
+			records.append(tuple(values) + (1, checked_at))
+
+		conn = self._connect()
+		conn.executemany('INSERT OR REPLACE INTO {tn} ({cols}, resolved, checked_at) VALUES ({qs})'.format(tn=self.table_name, cols=', '.join(CROSSWALK_COLS), \
+			qs=', '.join(['?'] * (len(CROSSWALK_COLS) + 2))), records)
+		conn.commit()
+		conn.close()
+
+	def load(self):
+		'''Return every resolved row in the crosswalk'''
+		conn = self._connect()
+		lookup = pd.read_sql_query('SELECT {cols} FROM {tn} WHERE resolved = 1'.format(cols=', '.join(CROSSWALK_COLS), tn=self.table_name), conn)
+		conn.close()
+
+		return lookup
+
+def _clean_ids(ids):
+	#unique ints, dropping NaNs from float columns
+	ids = pd.to_numeric(pd.Series(list(ids)), errors='coerce').dropna()
+	return [int(i) for i in ids.unique()]
+
+class KeyService(object):
+	'''
+	Dense integer ids for players, stadiums and games, so merges run on int64 columns instead of concatenated strings.
+
+	Each kind of value (player, stadium...) gets its own vocabulary: the first value seen is 0, the next 1, and so on.
+	The vocabularies are saved to filepath whenever they grow.  New values are added under a lock on the file, after
+	re-reading it, so several KeyServices (or processes) using the same file can only ever append - a value keeps its id.
+	Game keys pack the date and the player (and stadium) ids into one int64, and decode back to the string ids for display.
+	'''
+	def __init__(self, filepath='surrogate_keys.json'):
+		self.filepath = filepath
+		self.vocab = {}
+		self.reload()
+
+	def reload(self):
+		'''Pick up values other KeyServices have added to the file since it was last read'''
+		if self.filepath is None or not os.path.isfile(self.filepath):
+			return
+
+		with open(self.filepath) as f:
+			stored = {kind: pd.Index(values, dtype=object) for kind, values in json.load(f).items()}
+
+		for kind, vocab in self.vocab.items():
+			if not stored.get(kind, pd.Index([], dtype=object))[:len(vocab)].equals(vocab):
+				raise ValueError(self.filepath + " no longer starts with the " + kind + " ids in memory - keys built from it won't match")
+
+		self.vocab.update(stored)
+
+	def encode(self, kind, values, add=True):
+		"""
+		Map string values to their integer ids, adding any new values to the vocabulary
+
+		Parameters
+		----------
+		kind : str
+			vocabulary to use, eg 'player' or 'stadium'
+		values : array-like
+			values to encode
+		add : bool
+			give new values an id (and save them).  If False they get -1 and nothing is written
+
+		Returns
+		----------
+		numpy array
+			int64 ids, one per value
+
+		Raises
+		----------
+		ValueError
+			if any value is missing - it would otherwise be encoded as the string 'nan' and get a real id - or the
+			vocabulary outgrows its bits in the packed keys
+		"""
+		values = np.asarray(values, dtype=object)
+		missing = pd.isnull(values)
+		if missing.any():
+			raise ValueError("Can't encode %d missing %s values" % (missing.sum(), kind))
+
+		values = pd.Index(values.astype(str), dtype=object)
+		codes = self.vocab.get(kind, pd.Index([], dtype=object)).get_indexer(values)
+
+		if add and (codes == -1).any():
+			with self._file_lock():
+				#another KeyService may have added values since we read the file - append after them, never over them
+				self.reload()
+				vocab = self.vocab.get(kind, pd.Index([], dtype=object))
+				new_values = values[vocab.get_indexer(values) == -1].unique()
+
+				if len(new_values) > 0:
+					vocab = vocab.append(new_values)
+					if kind in KEY_BITS and len(vocab) > 2 ** KEY_BITS[kind]:
+						raise ValueError("More than 2**%d %s ids - they no longer fit in the packed game keys" % (KEY_BITS[kind], kind))
+
+					self.vocab[kind] = vocab
+					self.save()
+
+			codes = self.vocab[kind].get_indexer(values)
+
+		return codes.astype('int64')
+
+	def decode(self, kind, codes):
+		'''Map integer ids back to the string values they stand for'''
+		codes = np.asarray(codes, dtype='int64')
+		if len(codes) > 0 and codes.max() >= len(self.vocab.get(kind, [])):
+			self.reload()
+
+		return self.vocab[kind].values[codes]
+
+	def roto_game_key(self, game_dates, players, add=True):
+		'''int64 key for a player on a date - the integer version of roto_game_id.  -1 for players without an id when add is False'''
+		players = self.encode('player', players, add=add)
+		return np.where(players >= 0, (_day_number(game_dates) << 24) | players, -1)
+
+	def game_key(self, game_dates, stadiums, players, add=True):
+		'''int64 key for a player on a date in a stadium - the integer version of game_id.  -1 for unknown values when add is False'''
+		stadiums = self.encode('stadium', stadiums, add=add)
+		players = self.encode('player', players, add=add)
+		return np.where((stadiums >= 0) & (players >= 0), (_day_number(game_dates) << 32) | (stadiums << 24) | players, -1)
+
+	def roto_game_id(self, keys):
+		'''Decode roto_game_keys back to the string roto_game_id for display'''
+		keys = np.asarray(keys, dtype='int64')
+		dates = pd.to_datetime((keys >> 24).astype('datetime64[D]')).strftime('%Y-%m-%d')
+		return dates.values.astype(object) + self.decode('player', keys & 0xFFFFFF)
+
+	def join(self, left, right, on='roto_game_key', how='inner'):
+		"""
+		Join two frames on an integer key column.  If both frames have exactly the same keys in the same order (eg two feature
+		groups built from the same base frame) the columns are just placed side by side, otherwise it is a normal merge on the int key
+		"""
+		left_keys = left[on].to_numpy()
+		right_keys = right[on].to_numpy()
+
+		if len(left_keys) == len(right_keys) and (left_keys == right_keys).all():
+			return pd.concat([left.reset_index(drop=True), right.drop(on, axis=1).reset_index(drop=True)], axis=1)
+
+		return pd.merge(left, right, on=on, how=how)
+
+	def save(self):
+		if self.filepath is None:
+			return
+
+		#write a temp file and swap it in, so a KeyService reading without the lock never sees half a file
+		tmp_path = self.filepath + '.tmp'
+		with open(tmp_path, 'w') as f:
+			json.dump({kind: list(vocab) for kind, vocab in self.vocab.items()}, f)
+		os.replace(tmp_path, self.filepath)
+
+	@contextlib.contextmanager
+	def _file_lock(self):
+		#exclusive lock on a side file for the read-merge-write in encode.  nothing to lock for an in-memory KeyService
+		if self.filepath is None or fcntl is None:
+			yield
+			return
+
+		with open(self.filepath + '.lock', 'a') as lock_file:
+			fcntl.flock(lock_file, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _day_number(game_dates):
+	#days since 1970-01-01 as int64.  NaT would come out as a huge negative day number, so refuse it
+	days = pd.to_datetime(pd.Series(game_dates)).values.astype('datetime64[D]')
+	missing = np.isnat(days)
+	if missing.any():
+		raise ValueError("Can't build game keys for %d missing game dates" % missing.sum())
+
+	return days.astype('int64')
+
+class HandednessIndex(object):
+	'''
+	Pitches seen batting left and right handed, per batter per game date, stored as raw counts in a csv.
+
+	Only the batter, stand and game_date columns of the pitch data are read, in chunks, and only once - the batting hand
+	for any switch hitter cutoff is worked out from the stored counts.  Counts are kept by date so adding any range of
+	dates (eg the last week of a season) only reads those dates and merges with what is already stored.
+	'''
+	def __init__(self, filepath='batter_hand_counts.csv'):
+		self.filepath = filepath
+		self.counts = pd.DataFrame({'batter': pd.Series(dtype='int64'), 'game_date': pd.Series(dtype=object), \
+									'L': pd.Series(dtype='int64'), 'R': pd.Series(dtype='int64')})
+
+		if filepath is not None and os.path.isfile(filepath):
+			self.counts = pd.read_csv(filepath, dtype={'game_date': object})
+
+	def seasons(self):
+		'''Seasons that have counts'''
+		return sorted(self.counts['game_date'].str[:4].astype('int64').unique().tolist())
+
+	def add_chunks(self, chunks):
+		"""
+		Count pitches by batter, game date and batting side.  The counts of any date seen in the chunks replace the stored
+		counts for that date and every other date is kept, so reading a date again doesn't double count it and reading
+		part of a season doesn't lose the rest of it
+
+		Parameters
+		----------
+		chunks : iterable
+			pitch data dataframes with batter, stand and game_date columns.  A date's pitches can be spread over several
+			chunks, but every pitch of a date that is read has to be in them
+
+		Returns
+		----------
+		list
+			the dates that were updated, 'YYYY-MM-DD'
+		"""
+		totals = None
+		for chunk in chunks:
+			chunk = chunk[chunk['stand'].isin(['L', 'R']) & chunk['batter'].notnull()]
+			game_date = chunk['game_date'].astype(str).str[:10]
+
+			chunk_counts = chunk.groupby([chunk['batter'].astype('int64'), game_date.rename('game_date'), chunk['stand']]).size()
+			totals = chunk_counts if totals is None else totals.add(chunk_counts, fill_value=0)
+
+		if totals is None or len(totals) == 0:
+			return []
+
+		new_counts = totals.unstack('stand', fill_value=0).reindex(columns=['L', 'R'], fill_value=0).astype('int64').reset_index()
+		new_counts.columns.name = None
+		updated = sorted(new_counts['game_date'].unique().tolist())
+
+		self.counts = pd.concat([self.counts[~self.counts['game_date'].isin(updated)], new_counts], ignore_index=True)
+		self.counts = self.counts.sort_values(['batter', 'game_date']).reset_index(drop=True)
+
+		return updated
+
+	def update_from_csv(self, filepath, chunksize=STATCAST_CHUNKSIZE):
+		'''Add the counts from a statcast csv (eg statcast_cache.csv), reading only the three columns needed'''
+		return self.add_chunks(pd.read_csv(filepath, usecols=['batter', 'stand', 'game_date'], chunksize=chunksize))
+
+	def update_from_database(self, db_helper, start_date="", end_date="", table_name='pitch_data'):
+		'''Add the counts from the pitch data in a DatabaseHelper's sqlite file, for the games between two dates'''
+		chunks = db_helper.iter_statcast_chunks(start_date, end_date, table_name=table_name, columns=['batter', 'stand', 'game_date'])
+		return self.add_chunks(chunks if chunks is not None else [])
+
+	def hands(self, switch_cutoff=0.05, seasons=None):
+		"""
+		Batting hand of every batter.  A batter is a switch hitter ('S') if the pitches they saw from their less used side
+		are at least switch_cutoff of the pitches from their main side, otherwise 'L' or 'R'
+
+		Parameters
+		----------
+		switch_cutoff : float
+			minor side pitches / major side pitches at which a batter counts as a switch hitter
+		seasons : list
+			only use these seasons.  All of them if not given
+
+		Returns
+		----------
+		pandas dataframe
+			batter, L, R, batting_hand
+		"""
+		counts = self.counts if seasons is None else self.counts[self.counts['game_date'].str[:4].astype('int64').isin(seasons)]
+		hands = counts.groupby('batter')[['L', 'R']].sum().reset_index()
+
+		left = hands['L'].to_numpy()
+		right = hands['R'].to_numpy()
+		major = np.maximum(left, right)
+
+		with np.errstate(invalid='ignore', divide='ignore'):
+			switch_perc = np.where(major > 0, np.minimum(left, right) / major, 0.0)
+
+		hands['batting_hand'] = np.where(switch_perc < switch_cutoff, np.where(left > right, 'L', 'R'), 'S')
+
+		return hands
+
+	def save(self):
+		if self.filepath is None:
+			return
+
+		self.counts.to_csv(self.filepath, index=False)
+
 class DatabaseHelper(object):
-	def __init__(self, sql_filepath, key_joiner_filepath):
+	def __init__(self, sql_filepath, key_joiner_filepath, cache_dir='frame_cache', crosswalk_filepath='player_crosswalk.sqlite', keys_filepath='surrogate_keys.json'):
 		self.filepath = sql_filepath
 		self.key_join_path = key_joiner_filepath
+		self.cache = FrameCache(cache_dir)
+		self.crosswalk = PlayerCrosswalk(crosswalk_filepath)
+		self.keys = KeyService(keys_filepath)
 
-	def pull_raw_statcast_data(self, start_date = "", end_date = "", table_name = 'pitch_data'):
+	def pull_raw_statcast_data(self, start_date = "", end_date = "", table_name = 'pitch_data', columns=None, batters=None, pitchers=None, chunksize=None):
 		"""
 		Utility function to get raw pitch data from the sqlite file, using the filepath passed
 		on instantiation.
@@ -27,12 +723,204 @@ class DatabaseHelper(object):
 		end_date : str
 			End date in format 'YYYY-MM-DD'
 
+		columns : list
+			Columns to fetch from the table.  Fetches every column if not given
+
+		batters : list
+			MLBAM ids to limit the pull to.  All batters if not given
+
+		pitchers : list
+			MLBAM ids to limit the pull to.  All pitchers if not given
+
+		chunksize : int
+			If given, return a generator of dataframes with at most this many rows instead of one dataframe
+
 		Returns
 		----------
 		dataframe
-			A pandas dataframe of pitch data for the specified dates
+			A pandas dataframe of pitch data for the specified dates (or a generator of them if chunksize is set)
+		"""
+		chunks = self.iter_statcast_chunks(start_date=start_date, end_date=end_date, table_name=table_name, columns=columns, \
+											batters=batters, pitchers=pitchers, chunksize=chunksize or STATCAST_CHUNKSIZE)
+
+		if chunks is None:
+			return
+
+		if chunksize:
+			return chunks
+
+		#build the frame from the typed chunks - we never hold the whole result set as python tuples
+		chunk_list = list(chunks)
+		if len(chunk_list) == 0:
+			return pd.DataFrame(columns=self.statcast_columns(columns, table_name))
+
+		return pd.concat(chunk_list, ignore_index=True)
+
+	def iter_statcast_chunks(self, start_date="", end_date="", table_name='pitch_data', columns=None, batters=None, pitchers=None, chunksize=STATCAST_CHUNKSIZE):
+		"""
+		Stream pitch data out of the sqlite file in typed dataframe chunks.  Dates and player ids are passed to sqlite
+		as bound parameters, and the indexes on game_date, batter and pitcher are created first if they are missing so the
+		filters are index seeks rather than full table scans.
+
+		Parameters
+		----------
+		same as pull_raw_statcast_data
+
+		Returns
+		----------
+		generator
+			yields pandas dataframes of at most chunksize rows.  None if the dates are badly formatted
+		"""
+		dates = self.check_date_range(start_date, end_date)
+		if dates is None:
+			return
+
+		self.create_statcast_indexes(table_name)
+
+		select_cols = self.statcast_columns(columns, table_name)
+
+		#table and column names can't be bound, but they have been checked against the table schema above
+		query = 'SELECT {cols} FROM {tn} WHERE game_date >= ? AND game_date <= ?'.format(cols=', '.join('"' + c + '"' for c in select_cols), tn=table_name)
+		params = list(dates)
+
+		for cn, ids in [('batter', batters), ('pitcher', pitchers)]:
+			if ids is not None:
+				ids = [int(i) for i in ids]
+				query += ' AND {cn} IN ({qs})'.format(cn=cn, qs=', '.join(['?'] * len(ids)))
+				params += ids
+
+		return self._stream_query(query, params, select_cols, chunksize)
+
+	def _stream_query(self, query, params, names, chunksize):
+		#generator half of iter_statcast_chunks, kept separate so date errors are reported when the function is called
+		conn = sqlite3.connect(self.filepath)
+		try:
+			c = conn.cursor()
+			c.execute(query, params)
+
+			while True:
+				rows = c.fetchmany(chunksize)
+				if len(rows) == 0:
+					break
+
+				chunk = pd.DataFrame.from_records(rows, columns=names)
+				del rows
+
+				yield self.type_statcast_chunk(chunk)
+		finally:
+			conn.close()
+
+	def pull_statcast_event_counts(self, start_date="", end_date="", table_name='pitch_data'):
+		"""
+		Count the FanDuel scoring events (singles, doubles, triples, walks, HBP and home runs) for every batter in every game,
+		doing the filter and the pivot inside sqlite so only the aggregated rows are returned
+
+		Parameters
+		----------
+		start_date : str
+			Start date in format 'YYYY-MM-DD'
+
+		end_date : str
+			End date in format 'YYYY-MM-DD'
+
+		Returns
+		----------
+		dataframe
+			One row per (batter, game_date, home_team) with a count column per event
+		"""
+		dates = self.check_date_range(start_date, end_date)
+		if dates is None:
+			return
+
+		self.create_statcast_indexes(table_name)
+
+		event_sums = ',\n\t\t\t'.join(["SUM(CASE WHEN events = '{ev}' THEN 1 ELSE 0 END) AS {ev}".format(ev=ev) for ev in FD_BATTING_EVENTS])
+
+		query = '''
+			SELECT batter, game_date, home_team,
+			{sums}
+			FROM {tn}
+			WHERE game_date >= ? AND game_date <= ? AND events IN ({qs})
+			GROUP BY batter, game_date, home_team
+		'''.format(sums=event_sums, tn=table_name, qs=', '.join(['?'] * len(FD_BATTING_EVENTS)))
+
+		conn = sqlite3.connect(self.filepath)
+		c = conn.cursor()
+		c.execute(query, list(dates) + FD_BATTING_EVENTS)
+
+		names = [description[0] for description in c.description]
+		event_counts = pd.DataFrame.from_records(c.fetchall(), columns=names)
+		conn.close()
+
+		event_counts['batter'] = event_counts['batter'].astype('int64')
+		event_counts[FD_BATTING_EVENTS] = event_counts[FD_BATTING_EVENTS].astype('int16')
+
+		return event_counts
+
+	def pull_matchup_events(self, start_date="", end_date="", table_name='pitch_data'):
+		"""
+		Plate appearance results of every batter against every pitcher in every game, aggregated inside sqlite from the pitch
+		that ended each plate appearance
+
+		Parameters
+		----------
+		start_date : str
+			Start date in format 'YYYY-MM-DD'
+
+		end_date : str
+			End date in format 'YYYY-MM-DD'
+
+		Returns
+		----------
+		dataframe
+			One row per (batter, pitcher, game_pk, inning_topbot) with game_date, the batter's first at_bat_number against the
+			pitcher, the earliest sv_id of those plate appearances as first_pitch (None if the table has no sv_id), and
+			counts of pa, ab, hits, total_bases, walks (including HBP) and strikeouts
 		"""
+		dates = self.check_date_range(start_date, end_date)
+		if dates is None:
+			return
+
+		self.create_statcast_indexes(table_name)
+
+		#sv_id is the pitch's timestamp (YYMMDD_HHMMSS) - it orders the games of a double header, game_pk doesn't always
+		first_pitch = "MIN(NULLIF(sv_id, ''))" if 'sv_id' in self.statcast_columns(table_name=table_name) else 'NULL'
+
+		query = '''
+			SELECT batter, pitcher, game_pk, game_date, inning_topbot,
+			MIN(at_bat_number) AS first_at_bat,
+			{first_pitch} AS first_pitch,
+			COUNT(*) AS pa,
+			SUM(CASE WHEN events IN ({non_ab}) THEN 0 ELSE 1 END) AS ab,
+			SUM(CASE WHEN events IN ('single', 'double', 'triple', 'home_run') THEN 1 ELSE 0 END) AS hits,
+			SUM(CASE events WHEN 'single' THEN 1 WHEN 'double' THEN 2 WHEN 'triple' THEN 3 WHEN 'home_run' THEN 4 ELSE 0 END) AS total_bases,
+			SUM(CASE WHEN events IN ('walk', 'intent_walk', 'hit_by_pitch') THEN 1 ELSE 0 END) AS walks,
+			SUM(CASE WHEN events IN ('strikeout', 'strikeout_double_play') THEN 1 ELSE 0 END) AS strikeouts
+			FROM {tn}
+			WHERE game_date >= ? AND game_date <= ? AND events IS NOT NULL AND events != '' AND events NOT IN ({non_pa})
+			GROUP BY batter, pitcher, game_pk, game_date, inning_topbot
+		'''.format(tn=table_name, first_pitch=first_pitch, non_ab=', '.join(['?'] * len(STATCAST_NON_AB_EVENTS)), non_pa=', '.join(['?'] * len(STATCAST_NON_PA_EVENTS)))
+
+		conn = sqlite3.connect(self.filepath)
+		c = conn.cursor()
+		c.execute(query, STATCAST_NON_AB_EVENTS + list(dates) + STATCAST_NON_PA_EVENTS)
+
+		names = [description[0] for description in c.description]
+		matchups = pd.DataFrame.from_records(c.fetchall(), columns=names)
+		conn.close()
+
+		for col in ['batter', 'pitcher', 'game_pk']:
+			matchups[col] = matchups[col].astype('int64')
+		for col in ['pa', 'ab', 'hits', 'total_bases', 'walks', 'strikeouts']:
+			matchups[col] = matchups[col].astype('int32')
+
+		return matchups
 
+	def check_date_range(self, start_date="", end_date=""):
+		'''
+		Validate a start and end date, filling in the first and last dates in the database if either is empty.
+		Returns a (start_date, end_date) tuple, or None if either date is badly formatted
+		'''
 		#check for the right date formats if provided
 		if len(start_date) > 0:
 			try:
@@ -54,41 +942,78 @@ class DatabaseHelper(object):
 			#the last date in the database as of 1/19/2019
 			end_date = '2018-10-28'
 
-		#open a connection to the sqlite file
+		return start_date, end_date
+
+	def statcast_columns(self, columns=None, table_name='pitch_data'):
+		'''
+		Returns the list of columns to select from the pitch table.  Checks requested columns against the table so
+		they are safe to put in a query, and leaves out the junk 'index' and '<html>' columns from the raw pull
+		'''
 		conn = sqlite3.connect(self.filepath)
-		c = conn.cursor()
+		table_cols = [row[1] for row in conn.execute('PRAGMA table_info({tn})'.format(tn=table_name))]
+		conn.close()
 
-		column = 'game_date'
+		if len(table_cols) == 0:
+			raise ValueError("Table {tn} not found in {fp}".format(tn=table_name, fp=self.filepath))
 
-		#get all data from between the given start and end date
-		c.execute('SELECT * FROM {tn} WHERE {cn} >= "{sd}" AND {cn} <= "{ed}"'.\
-			format(tn=table_name, cn=column, sd=start_date, ed=end_date))
+		if columns is None:
+			return [c for c in table_cols if c not in STATCAST_DROP_COLS]
 
-		#we want to get the column names to map them to the pandas df
-		names = [description[0] for description in c.description]
+		missing = [c for c in columns if c not in table_cols]
+		if len(missing) > 0:
+			raise ValueError("Columns not in {tn}: {m}".format(tn=table_name, m=missing))
 
-		raw_data = pd.DataFrame(c.fetchall(), columns=names)
+		return list(columns)
 
-		raw_data.drop(columns=['index', '<html>'], inplace=True)
-
-		return raw_data
+	def create_statcast_indexes(self, table_name='pitch_data'):
+		'''
+		Create indexes on game_date, batter and pitcher if they don't already exist.  Only slow the first time it is run
+		'''
+		conn = sqlite3.connect(self.filepath)
+		for cn in STATCAST_INDEX_COLS:
+			conn.execute('CREATE INDEX IF NOT EXISTS idx_{tn}_{cn} ON {tn} ({cn})'.format(tn=table_name, cn=cn))
+		conn.commit()
+		conn.close()
 
-	def load_data(self, preload=True, path2018="", path2017="", write_csv=False, verbose=False):
+	def type_statcast_chunk(self, chunk):
 		'''
-		Utility function - load data from CSV if CSVs exist. If not, get raw data from .jl files.
+		Cast the columns we know about to compact numeric types.  Integer columns with missing values fall back to float
 		'''
+		for col, dtype in STATCAST_DTYPES.items():
+			if col in chunk.columns:
+				values = pd.to_numeric(chunk[col], errors='coerce')
+				if dtype.startswith('int') and values.isnull().any():
+					dtype = 'float64'
+				chunk[col] = values.astype(dtype)
 
-		if preload:
-			print("Trying to load raw csvs!")
+		return chunk
 
-			try:
-				batting_df = pd.read_csv('batting_df_master.csv')
-				pitching_df = pd.read_csv('pitching_df_master.csv')
+	def load_data(self, preload=True, path2018="", path2017="", write_csv=False, verbose=False, columns=None, start_date=None, end_date=None, compact=False):
+		'''
+		Utility function - load data from the frame cache if it exists. If not, fall back to the master CSVs (and cache them),
+		or get raw data from .jl files.
 
-				print("CSV's Loaded!! Returning batting and pitching df")
-			except FileNotFoundError:
-				print("Couldn't find the files raw_batting_df.csv and raw_pitching_df.csv in the current directory.")
-				return ""
+		columns, start_date and end_date limit what is read from the cache.  If compact is true, the frames are returned with
+		the compact_schema dtypes.
+		'''
+
+		if preload:
+			print("Trying to load cached frames!")
+
+			if not (self.cache.exists('batting_df_master') and self.cache.exists('pitching_df_master')):
+				print("No cached frames, trying raw csvs!")
+				try:
+					#parse the csvs one last time and store them typed so we never have to parse them again
+					self.cache.write(pd.read_csv('batting_df_master.csv'), 'batting_df_master')
+					self.cache.write(pd.read_csv('pitching_df_master.csv'), 'pitching_df_master')
+				except FileNotFoundError:
+					print("Couldn't find the files batting_df_master.csv and pitching_df_master.csv in the current directory.")
+					return ""
+
+			batting_df = self.cache.read('batting_df_master', columns=columns, start_date=start_date, end_date=end_date)
+			pitching_df = self.cache.read('pitching_df_master', columns=columns, start_date=start_date, end_date=end_date)
+
+			print("Cached frames loaded!! Returning batting and pitching df")
 		else:
 			if (len(path2017) == 0) or (len(path2018) == 0):
 				print("To load raw data, you must pass the path to bbref.jl and bbref_2018.jl")
@@ -96,52 +1021,117 @@ class DatabaseHelper(object):
 			else:
 				batting_df, pitching_df = self.combine_scraped_data(path2017=path2017, path2018=path2018, write_csv = write_csv, verbose=verbose)
 
+		if compact:
+			batting_df = self.compact_schema(batting_df)
+			pitching_df = self.compact_schema(pitching_df)
+
 		return batting_df, pitching_df
 
 
-	def pull_raw_bbref_data(self, filepath):
+	def compact_schema(self, df, verbose=True):
+		"""
+		Shrink a batting or pitching dataframe in memory.  Repeated string columns (player ids, teams, stadiums, day of week,
+		game situation...) become categoricals, the COMPACT_COUNT_COLS counting stats become int16 when they are whole numbers
+		with no missing values, integer columns get the smallest integer type that fits, and float columns become float32.
+
+		Parameters
+		----------
+		df : dataframe
+			frame to compact.  Not modified
+		verbose : bool
+			if true, print how many bytes were saved
+
+		Returns
+		----------
+		dataframe
+			the compacted frame
+		"""
+		bytes_before = df.memory_usage(deep=True).sum()
+		df = df.copy()
+
+		for col in df.columns:
+			values = df[col]
+
+			if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values) or isinstance(values.dtype, pd.CategoricalDtype):
+				continue
+
+			if pd.api.types.is_integer_dtype(values):
+				df[col] = pd.to_numeric(values, downcast='integer')
+			elif col in COMPACT_COUNT_COLS and values.notnull().all() and (values == np.round(values)).all() and values.abs().max() < 2 ** 15:
+				df[col] = values.astype('int16')
+			elif pd.api.types.is_numeric_dtype(values):
+				df[col] = values.astype('float32')
+
+			#only strings that repeat a lot are worth a categorical - ids like game_id are left alone
+			elif values.nunique() < COMPACT_CATEGORY_RATIO * len(values):
+				df[col] = values.astype('category')
+
+		if verbose:
+			bytes_after = df.memory_usage(deep=True).sum()
+			print("Compact schema: " + str(round(bytes_before / 1e6, 1)) + " MB -> " + str(round(bytes_after / 1e6, 1)) + " MB, saved " + \
+				str(round((bytes_before - bytes_after) / 1e6, 1)) + " MB")
+
+		return df
+
+	def pull_raw_bbref_data(self, filepath, offset=0, return_offset=False):
 		"""
 		Utility function to get raw game data from bbref file generated from scraping the baseball reference website.
 
 		Since this isn't stored in a database, we will just pull, clean, and return the bbref data - filtering can happen in pandas
 
+		The file is read one game (line) at a time and flattened straight into typed columns, so stats come out numeric
+		and columns are matched up by stat name rather than by position
+
 		Parameters
 		----------
 		filepath : str
 			location of the bbref.jl file
-		preload : bool
-			if true, look for csv's in same folder and load those instead of pulling raw data
-		write_csv : bool
-			if true, write a csv of batting_df and pitching_df after pulling raw data
+		offset : int
+			byte offset to start reading from - used to only read games appended since the last run
+		return_offset : bool
+			if true, also return the byte offset just past the last complete game that was read
 
 		Returns
 		----------
 		dataframe
 			A pandas dataframe of pitch data for the specified dates
 		"""
-		print("Reading in data..")
-		raw_df = pd.read_json(filepath, lines=True)
-
-		#first, we want to get information about what the columns will be from the raw dataframe
-		batter_stats = raw_df['away_batter_stats'][0]
-		pitcher_stats = raw_df['away_pitching_stats'][0]
-
-		#these are the 'game information' columns. the rest are stat specific
-		meta_info_cols = ['away_team', 'home_team', 'game_date', 'location', 'start_time', 'attendance', 'game_situation', 'player', 'team']
-
-		#get the first batter name so we can use it as a key
-		batter_name = next(iter(raw_df.iloc[0]['away_batter_stats']))
-		pitcher_name = next(iter(raw_df.iloc[0]['away_pitching_stats']))
-
-		#each entry in batter_stats and pitcher_stats is a dictionary representing a player - use specific players to get the keys (columns)
-		batting_stat_cols = meta_info_cols + list(batter_stats[batter_name].keys())
-		pitching_stat_cols = meta_info_cols + list(pitcher_stats[pitcher_name].keys())
-
-		#finally, parse the dictionaries in the raw dataframe to return a new dataframe where every row is the performance of an individual player in a single game
+		print("Reading in data and parsing stats..")
+		#stream the box scores one game at a time - every row in the flattened frames is the performance of an individual player in a single game
 		#create a separate batting and pitching df to make it easier to analyze
-		print("Parsing raw dictionaries to get stats...")
-		batting_df = pd.DataFrame(self.parse_bbref_batter_df(raw_df), columns=batting_stat_cols)
-		pitching_df = pd.DataFrame(self.parse_bbref_pitcher_df(raw_df), columns=pitching_stat_cols)
+		batting_flattener = BoxScoreFlattener(text_stats=BATTING_TEXT_STATS)
+		pitching_flattener = BoxScoreFlattener(text_stats=PITCHING_TEXT_STATS)
+
+		with open(filepath, 'rb') as f:
+			f.seek(offset)
+			for line in f:
+				try:
+					game = json.loads(line) if len(line.strip()) > 0 else None
+				except ValueError:
+					if line.endswith(b'\n'):
+						raise
+					#the scraper is still writing this game - pick it up on the next run
+					break
+				offset += len(line)
+
+				if game is None:
+					continue
+
+				meta_info = [game.get(col) for col in BBREF_META_COLS]
+
+				for team in ['away', 'home']:
+					batting_flattener.add_players(meta_info, team, game[team + '_batter_stats'])
+					pitching_flattener.add_players(meta_info, team, game[team + '_pitching_stats'])
+
+		batting_df = batting_flattener.to_frame()
+		pitching_df = pitching_flattener.to_frame()
+		del batting_flattener, pitching_flattener
+
+		if len(batting_df) == 0 and len(pitching_df) == 0:
+			print("No new games found!")
+			if return_offset:
+				return batting_df, pitching_df, offset
+			return batting_df, pitching_df
 
 		#DO DATA CLEANING BEFORE RETURNING
 		print("Cleaning dates...")
@@ -155,15 +1145,6 @@ class DatabaseHelper(object):
 		id_col = batting_df['game_date'].astype(str) + batting_df['stadium'] + batting_df['player']
 		batting_df.insert(loc=0, column='game_id', value=id_col)
 
-		print("Converting stats columns to numeric...")
-		#convert numeric columns to numeric - this will make it easier later on to select the appropriate columns for transformations
-		batting_cols = batting_df.columns.drop(['game_id', 'away_team', 'home_team', 'game_date', 'start_time', 'game_situation', 'player', 'team', 'PO', 'A', 'details', 'position', 'day_of_week', 'year', 'attendance', 'stadium'])
-		batting_df[batting_cols] = batting_df[batting_cols].apply(pd.to_numeric, errors='coerce', axis=1)
-
-		#same for pitching
-		pitching_cols = pitching_df.columns.drop(['game_id', 'away_team', 'home_team', 'game_date', 'start_time', 'game_situation', 'player', 'attendance', 'team', 'position', 'day_of_week', 'year', 'stadium'])
-		pitching_df[pitching_cols] = pitching_df[pitching_cols].apply(pd.to_numeric, errors='coerce', axis=1)
-
 		#we havent cleaned up the raw data yet - so drop duplicates
 		batting_df.drop_duplicates(inplace=True)
 		pitching_df.drop_duplicates(inplace=True)
@@ -176,6 +1157,8 @@ class DatabaseHelper(object):
 		#batting_df = batting_df[batting_df['game_date'] < '2018-08-01']
 
 		print("Raw data returned!")
+		if return_offset:
+			return batting_df, pitching_df, offset
 		return batting_df, pitching_df
 
 	def calc_pitching_fd_score(self, preload = True, path2017="", path2018="", write_csv=False):
@@ -201,94 +1184,38 @@ class DatabaseHelper(object):
 
 		#a win is indicated in a weird column - it's pulled from a text scrape on Baseball Reference thats in the same spot as the position for batters, which is why the column is called 'position'
 		#if the string in this column contains a 'W', we can say this pitcher got a win
-
-		#first convert NaNs to string so we can search using str.contains
-		pitching_df['position'] = pitching_df['position'].fillna("NA")
-		#then set a flag it was a win
-		pitching_df.loc[pitching_df['position'].str.contains('W'), 'win_recorded'] = 1
-		#fill the non wins with 0
-		pitching_df['win_recorded'] = pitching_df['win_recorded'].fillna(0)
+		pitching_df['win_recorded'] = pitching_df['position'].fillna("NA").str.contains('W').astype(bool)
 
 		#Fanduels uses a metric called 'quality starts' where points are given if a starting pitcher has a good game.  We need to calculate this
 
-		#first group and find the first pitcher of each game
-		qual_start_df = pitching_df.groupby(['game_date', 'stadium', 'start_time', 'team'])['player'].first().reset_index()
-
-		#then create a new id column we will join back to the original df on.  we want an ID for the game and team, not specific to the player
-		qual_start_df['first_pitch_id'] = qual_start_df['game_date'].astype(str) + qual_start_df['stadium'] + qual_start_df['start_time'] + qual_start_df['team']
-		#we need to create this ID in the other df too so we can merge
-		pitching_df['first_pitch_id'] = pitching_df['game_date'].astype(str) + pitching_df['stadium'] + pitching_df['start_time'] + pitching_df['team']
-
-		#take the subset of just the two columns we need - rename player so it doesn't duplicate
-		qual_start_df = qual_start_df[['first_pitch_id', 'player']]
-		qual_start_df.columns = ['first_pitch_id', 'first_pitcher']
-
-		#join it back to the original df
-		pitching_df = pd.merge(pitching_df, qual_start_df, on='first_pitch_id')
+		#the starter is the first pitcher listed for his team in each game.  rows are in box score order, so flag the first row
+		#for every (game, team) in one pass - no intermediate ids or merges needed
+		pitching_df['is_first_pitcher'] = ~pitching_df.duplicated(subset=['game_date', 'stadium', 'start_time', 'team'], keep='first')
 
-		#create a bool column to indicate if a row contains a starting pitcher
-		pitching_df.loc[pitching_df['player'] == pitching_df['first_pitcher'], 'is_first_pitcher'] = 1
-		pitching_df.loc[pitching_df['player'] != pitching_df['first_pitcher'], 'is_first_pitcher'] = 0
+		#a quality start is a starter going at least 6 innings with 3 or fewer earned runs
+		pitching_df['quality_start'] = pitching_df['is_first_pitcher'] & (pitching_df['ER'] <= 3) & (pitching_df['IP'] >= 6)
 
-		#lets clean up the dataframe and get rid of unneeded columns
-		pitching_df.drop(['first_pitcher', 'first_pitch_id'], axis=1, inplace=True)
+		#store the flags as 1 byte 1/0 ints - still compact, but numeric, so the feature averages pick them up (bool columns
+		#are skipped by select_dtypes(np.number))
+		flag_cols = ['win_recorded', 'is_first_pitcher', 'quality_start']
+		pitching_df[flag_cols] = pitching_df[flag_cols].astype('int8')
 
-		#find the quality starts using boolean filters
-		qual_start_df = pitching_df[(pitching_df['ER'] <= 3) & (pitching_df['is_first_pitcher'] == 1) & (pitching_df['IP'] >= 6)]
-
-		#qual_start_df['quality_start'] = 1
-		qual_start_df.insert(0, 'quality_start', 1)
-		#take only the columns we need
-		qual_start_df = qual_start_df[['game_id', 'quality_start']]
-
-		#merge back in to the original df, left join to keep all the original rows
-		pitching_df = pd.merge(pitching_df, qual_start_df, on='game_id', how='left')
-		pitching_df['quality_start'] = pitching_df['quality_start'].fillna(0)
-
-		#clean up memory
-		del qual_start_df
-
-		#finally, for each row in the df - calculate what the FD score should be
-		pitching_df['fd_score'] = pitching_df.apply(self.fd_pitching_score, axis=1)
-
-		#remove columns we don't need
-		pitching_df.drop(['quality_start'], axis=1, inplace=True)
+		#finally, calculate what the FD score should be for every row at once
+		pitching_df['fd_score'] = fantasy_scoring.pitching_score(pitching_df, site='FD')
 
 		return pitching_df
 
-	def fd_pitching_score(self, row):
-		#IP are worth 3 points per completed inning
-
-		#so if ip is 4.2, this will split and do:
-		#4*3 + 2 = 14 points
-		ip = str(row['IP']).split('.')
-		#first value is completed innings
-		ip_pts = int(ip[0])*3
-		#add the fractional value which should be 0,1,2
-		ip_pts += int(ip[1])
-
-		#SO are a straight 3 points per SO
-		so_pts = row['SO']*3
-
-		#ER are negative 3 points per 1 ER
-		er_pts = -(row['ER']*3)
-
-		#a win is worth 6 points
-		win_pts = row['win_recorded']*6
-
-		#and a quality start is worth 4 points
-		qual_start_pts = row['quality_start']*4
-
-		return ip_pts+so_pts+er_pts+win_pts+qual_start_pts
-
-	def calc_fd_scores_roto(self, start_date='2015-04-01', end_date='2018-07-19', preload=True, write_csv=False, path2017="", path2018=""):
+	def calc_fd_scores_roto(self, start_date='2015-04-01', end_date='2018-07-19', preload=True, write_csv=False, path2017="", path2018="", compact=False):
 		#the dates in rotoguru are in a weird format, need to clean them
 
 		# PART 1 - pull in bbref data and store as a df to be merge later
-		batting_df, pitching_df = self.load_data(preload=True, write_csv=False, path2017="", path2018="")
+		batting_df, pitching_df = self.load_data(preload=True, write_csv=False, path2017="", path2018="", compact=compact)
 		#Our batting and pitching df need to match on this new game_id
-		batting_df['roto_game_id'] = batting_df['game_date'] + batting_df['player']
-		pitching_df['roto_game_id'] = pitching_df['game_date'] + pitching_df['player']
+		batting_df['roto_game_id'] = batting_df['game_date'].astype(str) + batting_df['player'].astype(str)
+		pitching_df['roto_game_id'] = pitching_df['game_date'].astype(str) + pitching_df['player'].astype(str)
+		#integer version of the same key - this is what we actually merge on
+		batting_df['roto_game_key'] = self.keys.roto_game_key(batting_df['game_date'], batting_df['player'])
+		pitching_df['roto_game_key'] = self.keys.roto_game_key(pitching_df['game_date'], pitching_df['player'])
 
 		print("Loading rotoguru data..")
 
@@ -300,7 +1227,7 @@ class DatabaseHelper(object):
 		#match rotoguru to baseball reference with different keys
 		print("Getting bbref key to merge rotoguru and bbref data")
 		unique_players = list(rotoguru['MLB_ID'].unique())
-		lookup = playerid_reverse_lookup(unique_players)
+		lookup = self.crosswalk.lookup(unique_players)
 
 		rotoguru = pd.merge(rotoguru, lookup[['key_mlbam', 'key_bbref']], left_on='MLB_ID', right_on='key_mlbam')
 
@@ -310,17 +1237,18 @@ class DatabaseHelper(object):
 		rotoguru.drop('Date', axis=1, inplace=True)
 
 		print("Merging bbref and rotoguru data to get FD scores")
+		#players without a bbref key can't match any bbref rows, so drop them before building keys
+		rotoguru = rotoguru[rotoguru['key_bbref'].notnull()]
 		#create a unique id to merge rotoguru and bbref data
-		rotoguru['roto_game_id'] = rotoguru['game_date'] + rotoguru['key_bbref']
+		rotoguru['roto_game_key'] = self.keys.roto_game_key(rotoguru['game_date'], rotoguru['key_bbref'])
 
 		print("Batting df pre merge: ", batting_df.shape)
-		rotoguru = rotoguru[['roto_game_id', 'FD_points', 'Pos']]
-		batting_df = pd.merge(batting_df, rotoguru, on='roto_game_id')
+		rotoguru = rotoguru[['roto_game_key', 'FD_points', 'Pos']]
+		batting_df = pd.merge(batting_df, rotoguru, on='roto_game_key')
 		print("Batting df post merge: ", batting_df.shape)
 
 		print("Pitching df pre merge: ", pitching_df.shape)
-		rotoguru = rotoguru[['roto_game_id', 'FD_points', 'Pos']]
-		pitching_df = pd.merge(pitching_df, rotoguru, on='roto_game_id')
+		pitching_df = pd.merge(pitching_df, rotoguru, on='roto_game_key')
 		print("Pitching df post merge: ", pitching_df.shape)
 
 		#we want to remove pitchers - we're not going to include them in the batting model, we have a separate df for pitching
@@ -329,13 +1257,14 @@ class DatabaseHelper(object):
 
 		return batting_df, pitching_df
 
-	def calc_batting_fd_score(self, start_date='2015-04-01', end_date='2018-07-19', preload=True, write_csv=False, path2017="", path2018=""):
+	def calc_batting_fd_score(self, start_date='2015-04-01', end_date='2018-07-19', preload=True, write_csv=False, path2017="", path2018="", aggregate_in_db=True):
 		# PART 1 - get bbref data
 		# Inputs:
 		# start_date - beginning of time to pull statcast data
 		# stop_date - time to cease pulling statcast data
 		# Filepath1 - include path to filepath to bbref .jl file from scraper
 		# Filepath2 - include path to baseball_name_translator
+		# aggregate_in_db - count scoring events in sqlite instead of loading every pitch through the statcast cache
 
 		# Outputs:
 		# DF of batting stats merged from both bbref and statcast sources
@@ -348,23 +1277,27 @@ class DatabaseHelper(object):
 		batting_df, pitching_df = self.load_data(path2017=path2017, path2018=path2018, preload=preload, write_csv=write_csv)
 
 		# PART 2 - get statcast data
-		try:
-			print("Accessing statcast_cache...")
-			print("If dates are missing try rebuilding cache...")
-			statcast_input_frame = pd.read_csv('statcast_cache.csv')
-		except:
-			print("Getting raw statcast data...")
-			statcast_input_frame = self.pull_raw_statcast_data(start_date=start_date, end_date=end_date)
-			statcast_input_frame.to_csv('statcast_cache.csv')
+		if aggregate_in_db:
+			# sqlite filters to the scoring events and pivots them per batter-game, so we only move player-games out of the database
+			print("Aggregating statcast events in the database...")
+			statcast_df = self.pull_statcast_event_counts(start_date=start_date, end_date=end_date)
+		else:
+			if self.cache.exists('statcast'):
+				print("Accessing statcast cache...")
+				print("If dates are missing try rebuilding cache...")
+				statcast_input_frame = self.cache.read('statcast', start_date=start_date, end_date=end_date)
+			else:
+				print("Getting raw statcast data...")
+				statcast_input_frame = self.pull_raw_statcast_data(start_date=start_date, end_date=end_date)
+				self.cache.write(statcast_input_frame, 'statcast')
 
-		events_worth_points = ['single', 'double', 'triple', 'walk', 'hit_by_pitch', 'home_run', 'hit_by_pitch']
-		statcast_df = statcast_input_frame[ statcast_input_frame['events'].isin(events_worth_points) ]
+			statcast_df = statcast_input_frame[ statcast_input_frame['events'].isin(FD_BATTING_EVENTS) ]
 
 		# Gets a list of batter keys, (unique list prevents repeat occurances)
 		player_list = list(statcast_df['batter'].unique().astype(int))
 
 		# Lookup keys to get each player's various keys (mlb, bbref, etc.)
-		player_id_values = playerid_reverse_lookup(player_list, key_type='mlbam')
+		player_id_values = self.crosswalk.lookup(player_list)
 
 		# Merge player keys to batter df based on key
 		cols_to_merge = ['name_last', 'name_first', 'key_mlbam', 'key_bbref', 'key_fangraphs', 'key_retro']
@@ -389,22 +1322,26 @@ class DatabaseHelper(object):
 		statcast_df_3['game_id'] = statcast_df_3['game_date'] + \
 									statcast_df_3['stadium'] + \
 									statcast_df_3['key_bbref'].astype(str)
-		print("Aggregating data...")
-		# Counts and groups events by game_id and event type, then unpacks events via unstack into their own columns
-		batter_agg = statcast_df_3.groupby(['batter', 'home_team', 'game_date', 'game_id', 'events']).size() \
-									.unstack(fill_value=0)
-		batter_agg2 = batter_agg.reset_index()
-
-		# Aggregates fan duel values
-		batter_agg3 = batter_agg2.groupby(['batter', 'home_team', 'game_date', 'game_id']) \
-											.agg({ 'hit_by_pitch' : 'sum', \
-											'home_run' : 'sum', \
-											'single' : 'sum', \
-											'double' : 'sum', \
-											'triple' : 'sum', \
-											'walk' : 'sum', \
-											'hit_by_pitch' : 'sum'})
-		statcast_data = batter_agg3.reset_index()
+		if aggregate_in_db:
+			# already one row per batter-game with a column per event
+			statcast_data = statcast_df_3[['batter', 'home_team', 'game_date', 'game_id'] + FD_BATTING_EVENTS]
+		else:
+			print("Aggregating data...")
+			# Counts and groups events by game_id and event type, then unpacks events via unstack into their own columns
+			batter_agg = statcast_df_3.groupby(['batter', 'home_team', 'game_date', 'game_id', 'events']).size() \
+										.unstack(fill_value=0)
+			batter_agg2 = batter_agg.reset_index()
+
+			# Aggregates fan duel values
+			batter_agg3 = batter_agg2.groupby(['batter', 'home_team', 'game_date', 'game_id']) \
+												.agg({ 'hit_by_pitch' : 'sum', \
+												'home_run' : 'sum', \
+												'single' : 'sum', \
+												'double' : 'sum', \
+												'triple' : 'sum', \
+												'walk' : 'sum', \
+												'hit_by_pitch' : 'sum'})
+			statcast_data = batter_agg3.reset_index()
 
 		print("Merging bbref and statcast data...")
 		# Merge statcast and bbref databases, dropna (there are a lot b/c statcast has +1 year of data with no bbref values)
@@ -414,7 +1351,7 @@ class DatabaseHelper(object):
 		#batter_dataframe_final = batter_dataframe_final.dropna()
 
 		# Score game performance
-		batter_dataframe_final['fd_score'] = batter_dataframe_final.apply(self.fd_batting_score, axis=1)
+		batter_dataframe_final['fd_score'] = fantasy_scoring.batting_score(batter_dataframe_final, site='FD')
 
 		# NAN values after the bbref-statcast join a lack of value for an in game event.  A player
 		# who has at lease 1 AT BAT in a game, but fails to generate a FD scoring event, returns a NAN
@@ -432,107 +1369,7 @@ class DatabaseHelper(object):
 		print("Batting FD Score calculated! Returning data..")
 		return batter_dataframe_final
 
-	def fd_batting_score(self, row):
-
-		# Null batter indicates a misalignment with bbref and statcast
-		if math.isnan(row['batter']):
-			# This returns 0 for AT BATs that result in strikeouts, flyouts, and nonscoring events
-			if (row['H'] == 0) and (row['RBI'] == 0) and row['BB'] == 0:
-				return 0
-			# This returns scoring values under specific conditions that dont not involving batting
-			else:
-				y = 0
-				y = y + float(row['RBI']) * 3.5
-				y = y + float(row['R']) * 3.2
-				y = y + float(row['BB']) * 3
-				return y
-
-		x = 0
-		# Does data capture the following scenario:
-		# 1 x HR = 12pts + 3.2pts <- is this how fanduel works?
-		x = x + float(row['RBI']) * 3.5
-		x = x + float(row['R']) * 3.2
-		x = x + float(row['BB']) * 3
-		x = x + row['single'] * 3
-		x = x + row['double'] * 6
-		x = x + row['triple'] * 9
-		x = x + row['home_run'] * 12
-		x = x + row['hit_by_pitch'] * 3
-
-		return x
-
 	#some utility functions for cleaning up the raw BBRef data.  They could be nicer, but they work for now.
-	def parse_bbref_batter_df(self, df):
-		all_batter_list = []
-		for i in range(0, len(df)):
-			row = df.iloc[i]
-			meta_info_list = []
-			meta_info_list.append(row['away_team'])
-			meta_info_list.append(row['home_team'])
-			meta_info_list.append(row['game_date'])
-			meta_info_list.append(row['location'])
-			meta_info_list.append(row['start_time'])
-			meta_info_list.append(row['attendance'])
-			meta_info_list.append(row['game_situation'])
-
-			away_batter_stats = row['away_batter_stats']
-
-			for player in away_batter_stats.keys():
-				temp_list = []
-				temp_list.append(player)
-				temp_list.append("away")
-				for value in away_batter_stats[player].values():
-					temp_list.append(value)
-				all_batter_list.append(meta_info_list + temp_list)
-
-			home_batter_stats = row['home_batter_stats']
-
-			for player in home_batter_stats.keys():
-				temp_list = []
-				temp_list.append(player)
-				temp_list.append('home')
-				for value in home_batter_stats[player].values():
-					temp_list.append(value)
-				all_batter_list.append(meta_info_list + temp_list)
-
-		return all_batter_list
-
-	def parse_bbref_pitcher_df(self, df):
-		all_pitcher_list = []
-		for i in range(0, len(df)):
-			row = df.iloc[i]
-			meta_info_list = []
-			meta_info_list.append(row['away_team'])
-			meta_info_list.append(row['home_team'])
-			meta_info_list.append(row['game_date'])
-			meta_info_list.append(row['location'])
-			meta_info_list.append(row['start_time'])
-			meta_info_list.append(row['attendance'])
-			meta_info_list.append(row['game_situation'])
-
-			away_pitcher_stats = row['away_pitching_stats']
-
-			for player in away_pitcher_stats.keys():
-				temp_list = []
-				temp_list.append(player)
-				temp_list.append("away")
-				for value in away_pitcher_stats[player].values():
-					temp_list.append(value)
-				all_pitcher_list.append(meta_info_list + temp_list)
-
-			home_pitcher_stats = row['home_pitching_stats']
-
-			for player in home_pitcher_stats.keys():
-				temp_list = []
-				temp_list.append(player)
-				temp_list.append('home')
-				for value in home_pitcher_stats[player].values():
-					temp_list.append(value)
-				all_pitcher_list.append(meta_info_list + temp_list)
-
-		return all_pitcher_list
-
-
 	def clean_up_dates(self, df):
 		'''
 			General cleanup of bbref data before returning it.  Things like formatting dates, location, etc
@@ -577,10 +1414,17 @@ class DatabaseHelper(object):
 
 		return clean_date
 
-	def combine_scraped_data(self, path2018, path2017, write_csv=False, verbose=False):
-		'''This function is a utility function that combines the multiple scraped data files we have.  We have saved the datasets to a CSV, but if we ever need to recreate them'''
+	def combine_scraped_data(self, path2018, path2017, write_csv=False, verbose=False, write_cache=True, incremental=False):
+		'''
+		This function is a utility function that combines the multiple scraped data files we have.  We have saved the datasets to the frame cache, but if we ever need to recreate them
+
+		If incremental is true, only games appended to the files since the last run are parsed and added to the cache.  See ingest_new_scraped_data
+		'''
+		if incremental:
+			return self.ingest_new_scraped_data(path2018=path2018, path2017=path2017, verbose=verbose)
+
 		#get the separate datasets from hardcoded locations
-		batting_df_2017, pitching_df_2017 = self.pull_raw_bbref_data(filepath=path2017)
+		batting_df_2017, pitching_df_2017, offset_2017 = self.pull_raw_bbref_data(filepath=path2017, return_offset=True)
 
 		if verbose:
 			print("Merges for combine_scraped_data")
@@ -588,17 +1432,17 @@ class DatabaseHelper(object):
 			print("Batting DF 2015-2017 shape: ", batting_df_2017.shape)
 			print("Pitching DF 2015-2017 shape: ", pitching_df_2017.shape)
 
-		batting_df_2018, pitching_df_2018 = self.pull_raw_bbref_data(filepath=path2018)
+		batting_df_2018, pitching_df_2018, offset_2018 = self.pull_raw_bbref_data(filepath=path2018, return_offset=True)
 
 		if verbose:
 			print("Batting DF 2018 shape: ", batting_df_2018.shape)
 			print("Pitching DF 2018 shape: ", pitching_df_2018.shape)
 
 		#2018 data contained some old data from other years, vice versa for 2017.  make sure each is cleaned to the appropriate year
-		batting_df_2018 = batting_df_2018[batting_df_2018['year'] == 2018.0]
-		pitching_df_2018 = pitching_df_2018[pitching_df_2018['year'] == 2018.0]
-		batting_df_2017 = batting_df_2017[batting_df_2017['year'] < 2018.0]
-		pitching_df_2017 = pitching_df_2017[pitching_df_2017['year'] < 2018.0]
+		batting_df_2018 = self.filter_scraped_year(batting_df_2018, is_2018=True)
+		pitching_df_2018 = self.filter_scraped_year(pitching_df_2018, is_2018=True)
+		batting_df_2017 = self.filter_scraped_year(batting_df_2017, is_2018=False)
+		pitching_df_2017 = self.filter_scraped_year(pitching_df_2017, is_2018=False)
 
 		batting_df = pd.concat([batting_df_2017, batting_df_2018])
 		pitching_df = pd.concat([pitching_df_2017, pitching_df_2018])
@@ -613,21 +1457,121 @@ class DatabaseHelper(object):
 			batting_df.to_csv("batting_df_master.csv", index=False, header=True)
 			pitching_df.to_csv("pitching_df_master.csv", index=False, header=True)
 
+		if write_cache:
+			self.cache.write(batting_df, 'batting_df_master')
+			self.cache.write(pitching_df, 'pitching_df_master')
+
+			#record how far into each file we got and which games are stored, so the next run can be incremental
+			state = {'offsets': {os.path.abspath(path2017): offset_2017, os.path.abspath(path2018): offset_2018}, 'game_keys': []}
+			self.update_ingest_state(state, batting_df, pitching_df)
+			self.save_ingest_state(state)
+
 		return batting_df, pitching_df
 
-	def create_player_lookup_csv(self):
+	def ingest_new_scraped_data(self, path2018, path2017, verbose=False):
 		"""
-		Use pybaseball's lookup feature to generate a csv of all players names and ids in
-		the raw database
+		Parse only the games appended to bbref.jl and bbref_2018.jl since the last run, and append them to the cached
+		master frames.  The byte offset reached in each file and the games already stored are kept in
+		ingest_state.json in the cache directory.  Falls back to a full combine_scraped_data if there is no state yet
+
+		Returns
+		----------
+		batting_df, pitching_df
+			the full master frames, including the new games
+		"""
+		state = self.load_ingest_state()
+
+		if state is None or not (self.cache.exists('batting_df_master') and self.cache.exists('pitching_df_master')):
+			print("No ingest state found, rebuilding from scratch...")
+			return self.combine_scraped_data(path2018=path2018, path2017=path2017, verbose=verbose)
+
+		known_games = set(state['game_keys'])
+		new_batting, new_pitching = [], []
+
+		for path, is_2018 in [(path2017, False), (path2018, True)]:
+			key = os.path.abspath(path)
+			offset = state['offsets'].get(key, 0)
+
+			#if the file got smaller it was rewritten - read it all again, the game keys stop us double counting
+			if os.path.getsize(path) < offset:
+				offset = 0
+
+			batting_df, pitching_df, state['offsets'][key] = self.pull_raw_bbref_data(filepath=path, offset=offset, return_offset=True)
+
+			if len(batting_df) == 0 and len(pitching_df) == 0:
+				continue
 
+			batting_df = self.filter_scraped_year(batting_df, is_2018=is_2018)
+			pitching_df = self.filter_scraped_year(pitching_df, is_2018=is_2018)
+
+			#drop any games that are already in the master frames
+			new_batting.append(batting_df[~self.scraped_game_keys(batting_df).isin(known_games)])
+			new_pitching.append(pitching_df[~self.scraped_game_keys(pitching_df).isin(known_games)])
+
+		if len(new_batting) > 0:
+			batting_df = pd.concat(new_batting)
+			pitching_df = pd.concat(new_pitching)
+
+			if verbose:
+				print("New batting rows: ", batting_df.shape)
+				print("New pitching rows: ", pitching_df.shape)
+
+			self.cache.append(batting_df, 'batting_df_master')
+			self.cache.append(pitching_df, 'pitching_df_master')
+			self.update_ingest_state(state, batting_df, pitching_df)
+
+		self.save_ingest_state(state)
+
+		return self.cache.read('batting_df_master'), self.cache.read('pitching_df_master')
+
+	def filter_scraped_year(self, df, is_2018):
+		'''The 2018 file contains some old data from other years and vice versa - keep only the years each file is responsible for'''
+		if is_2018:
+			return df[df['year'] == 2018.0]
+		return df[df['year'] < 2018.0]
+
+	def scraped_game_keys(self, df):
+		'''
+		One key per game (not per player).  The start time is part of it so both games of a double header are kept, same
+		as the game grouping for is_first_pitcher
+		'''
+		return pd.to_datetime(df['game_date']).dt.strftime('%Y-%m-%d') + df['home_team'] + df['away_team'] + df['start_time'].fillna('').astype(str)
+
+	def ingest_state_path(self):
+		return os.path.join(self.cache.cache_dir, 'ingest_state.json')
+
+	def load_ingest_state(self):
+		try:
+			with open(self.ingest_state_path()) as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+
+	def save_ingest_state(self, state):
+		os.makedirs(self.cache.cache_dir, exist_ok=True)
+		with open(self.ingest_state_path(), 'w') as f:
+			json.dump(state, f)
+
+	def update_ingest_state(self, state, batting_df, pitching_df):
+		#add the games in the given frames to the state
+		game_keys = set(state['game_keys'])
+		game_keys.update(self.scraped_game_keys(batting_df))
+		game_keys.update(self.scraped_game_keys(pitching_df))
+		state['game_keys'] = sorted(game_keys)
+
+	def create_player_lookup_csv(self):
 		"""
-		raw_data = self.pull_raw_data()
+		Make sure every batter and pitcher in the raw database is in the player crosswalk, then write the crosswalk
+		to player_lookup.csv
 
-		batter_ids = set(raw_data.batter.unique())
-		pitcher_ids = set(raw_data.pitcher.unique())
-		player_ids = batter_ids.union(pitcher_ids)
+		"""
+		player_ids = set()
+		for chunk in self.pull_raw_statcast_data(columns=['batter', 'pitcher'], chunksize=STATCAST_CHUNKSIZE):
+			player_ids.update(chunk['batter'].unique())
+			player_ids.update(chunk['pitcher'].unique())
 
-		pybaseball.playerid_reverse_lookup(list(player_ids)).to_csv('player_lookup.csv')
+		self.crosswalk.refresh(player_ids)
+		self.crosswalk.load().to_csv('player_lookup.csv', index=False)
 
 	def load_player_lookup_df(self, filepath='player_lookup.csv'):
 		try:
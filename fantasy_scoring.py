@@ -0,0 +1,107 @@
+import numpy as np
+
+#Scoring rules for each fantasy site, written as stat column -> points so every score is a weighted sum of columns.
+#Only FanDuel for now - another site goes in here once its rules are checked against its actual points in the rotoguru data.
+#Batting stats are the bbref box score columns plus the statcast event counts (single, double, triple, home_run, hit_by_pitch).
+#Pitching stats are the bbref box score columns plus win_recorded and quality_start from calc_pitching_fd_score.
+#
+#fallback is used for batters that didn't match up with statcast (null 'when_null' column) - only bbref stats are
+#scored, and the batter gets 0 unless at least one of 'zero_unless_any' is non zero
+SCORING_RULES = {
+	'FD': {
+		'batting': {
+			'points': {'RBI': 3.5, 'R': 3.2, 'BB': 3, 'single': 3, 'double': 6, 'triple': 9, 'home_run': 12, 'hit_by_pitch': 3},
+			'fallback': {
+				'when_null': 'batter',
+				'points': {'RBI': 3.5, 'R': 3.2, 'BB': 3},
+				'zero_unless_any': ['H', 'RBI', 'BB'],
+			},
+		},
+		'pitching': {
+			#3 points per completed inning, so 1 per out
+			'points_per_out': 1,
+			'points': {'SO': 3, 'ER': -3, 'win_recorded': 6, 'quality_start': 4},
+		},
+	},
+}
+
+def innings_to_outs(ip):
+	'''
+	Convert innings pitched in box score notation (4.2 = 4 innings and 2 outs) to a number of outs
+
+	Parameters
+	-----------
+		ip : array-like
+			innings pitched
+
+	Returns
+	-----------
+		numpy array
+			outs recorded, NaN where ip is NaN
+	'''
+	ip = np.asarray(ip, dtype='float64')
+	full_innings = np.floor(ip)
+
+	#the decimal is a count of outs, not a fraction - round to get rid of float error (4.2 - 4 = 0.2000001)
+	partial_outs = np.round((ip - full_innings) * 10)
+
+	return full_innings * 3 + partial_outs
+
+def batting_score(df, site='FD'):
+	'''
+	Calculate fantasy points for every row of a batting dataframe at once
+
+	Parameters
+	-----------
+		df : pandas dataframe
+			batting stats, one row per player per game
+		site : str
+			key in SCORING_RULES
+
+	Returns
+	-----------
+		numpy array
+			fantasy points for each row
+	'''
+	rules = SCORING_RULES[site]['batting']
+	score = _weighted_sum(df, rules['points'])
+
+	fallback = rules.get('fallback')
+	if fallback is not None:
+		fallback_score = _weighted_sum(df, fallback['points'])
+
+		scored_something = np.zeros(len(df), dtype=bool)
+		for col in fallback['zero_unless_any']:
+			scored_something |= df[col].to_numpy(dtype='float64') != 0
+		fallback_score = np.where(scored_something, fallback_score, 0.0)
+
+		score = np.where(df[fallback['when_null']].isnull().to_numpy(), fallback_score, score)
+
+	return score
+
+def pitching_score(df, site='FD'):
+	'''
+	Calculate fantasy points for every row of a pitching dataframe at once
+
+	Parameters
+	-----------
+		df : pandas dataframe
+			pitching stats, one row per player per game.  Needs 'IP' plus the columns in the site's rules
+		site : str
+			key in SCORING_RULES
+
+	Returns
+	-----------
+		numpy array
+			fantasy points for each row
+	'''
+	rules = SCORING_RULES[site]['pitching']
+
+	return innings_to_outs(df['IP']) * rules['points_per_out'] + _weighted_sum(df, rules['points'])
+
+def _weighted_sum(df, points):
+	total = np.zeros(len(df), dtype='float64')
+	for col, pts in points.items():
+		total += df[col].to_numpy(dtype='float64') * pts
+
+	return total
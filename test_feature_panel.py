@@ -0,0 +1,143 @@
+'''
+Checks the panel based features in baseball_models against straightforward pandas groupby references on a small synthetic
+frame of player games.  Run with pytest
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from baseball_models import FeatureEngineer, OnlineFeatureState
+
+COLS = ['AB', 'H', 'batting_avg']
+WINDOWS = [7,14,21,28,42]
+
+@pytest.fixture
+def games():
+	'''
+	A few players over three seasons, each with their own schedule (gaps, off days, one who only shows up in the last season),
+	NaNs in batting_avg, and rows shuffled so nothing relies on the input order
+	'''
+	rng = np.random.default_rng(7)
+	seasons = [pd.date_range(str(year) + '-04-01', str(year) + '-09-30') for year in [2015, 2016, 2017]]
+	days = seasons[0].append(seasons[1]).append(seasons[2])
+
+	rows = []
+	for p in range(8):
+		#the last player only plays in 2017
+		pool = seasons[2] if p == 7 else days
+		for day in np.sort(rng.choice(pool, size=70, replace=False)):
+			rows.append(('player' + str(p), pd.Timestamp(day)))
+
+	df = pd.DataFrame(rows, columns=['player', 'game_date'])
+	df = df.sample(frac=1, random_state=7).reset_index(drop=True)
+	df['year'] = df['game_date'].dt.year.astype(float)
+	df['game_date'] = df['game_date'].dt.strftime('%Y-%m-%d')
+
+	n = len(df)
+	df['AB'] = rng.integers(0, 6, n).astype(float)
+	df['H'] = rng.integers(0, 4, n).astype(float)
+	df['batting_avg'] = np.where(rng.random(n) < 0.15, np.nan, rng.random(n))
+	df['FD_points'] = rng.random(n) * 20
+
+	return df
+
+@pytest.fixture
+def engineer(games, tmp_path):
+	#no keys file, so the KeyService hands out ids in memory
+	return FeatureEngineer(games, crosswalk_filepath=str(tmp_path / 'crosswalk.sqlite'), keys_filepath=None)
+
+def reference(df):
+	'''The lifetime, ytd and N game averages the way the original per column groupby code computed them'''
+	df = df.sort_values(['player', 'game_date'])
+	by_player = df.groupby('player')
+	out = pd.DataFrame(index=df.index)
+
+	for col in COLS:
+		out[col + '_lifeavg'] = by_player[col].transform(lambda x: x.expanding().mean().shift())
+
+		#the season average is shifted within the player, not the season, so a player's first game of a season gets his
+		#full average from the season before
+		season = df.groupby(['player', 'year'])[col].transform(lambda x: x.expanding().mean())
+		out[col + '_ytdavg'] = season.groupby(df['player']).shift()
+
+		for window in WINDOWS:
+			out[col + '_' + str(window) + 'dayavg'] = by_player[col].transform(lambda x: x.rolling(window, window).mean().shift())
+
+	return out
+
+def calendar_reference(df, col, days):
+	'''Sum, mean and game count of col over each player's games in the N days before the game, by brute force'''
+	dates = pd.to_datetime(df['game_date'])
+	sums, means, counts = [], [], []
+
+	for i in df.index:
+		window = df.loc[(df['player'] == df.at[i, 'player']) & (dates < dates[i]) & (dates >= dates[i] - pd.Timedelta(days=days)), col]
+		sums.append(window.sum())
+		means.append(window.mean())
+		counts.append(len(window))
+
+	return pd.DataFrame({'sum': sums, 'mean': means, 'games': counts}, index=df.index)
+
+def test_rolling_avg_matches_groupby(engineer):
+	out = engineer.calc_rolling_avg()
+	expected = reference(engineer.avg_df)
+
+	assert list(out.index) == list(engineer.avg_df.index)
+	for col in COLS:
+		for window in WINDOWS:
+			name = col + '_' + str(window) + 'dayavg'
+			pd.testing.assert_series_equal(out[name], expected.loc[out.index, name], check_names=False)
+
+def test_lifetime_and_ytd_match_groupby(engineer):
+	names = [col + '_lifeavg' for col in COLS] + [col + '_ytdavg' for col in COLS]
+	out = engineer.calc_features(names)
+	expected = reference(engineer.avg_df)
+
+	assert list(out.columns) == ['roto_game_id', 'roto_game_key'] + names
+	for name in names:
+		pd.testing.assert_series_equal(out[name], expected.loc[out.index, name], check_names=False)
+
+def test_calendar_windows_match_brute_force(engineer):
+	out = engineer.calc_calendar_avgs(windows=[7,30])
+	df = engineer.avg_df
+
+	for days in [7,30]:
+		for col in ['H', 'batting_avg']:
+			expected = calendar_reference(df, col, days)
+			np.testing.assert_allclose(out[col + '_' + str(days) + 'daysum'], expected['sum'])
+			np.testing.assert_allclose(out[col + '_' + str(days) + 'dayavg'], expected['mean'])
+		np.testing.assert_array_equal(out['games_' + str(days) + 'daycount'], expected['games'])
+
+def test_calc_features_by_name_matches_full_groups(engineer):
+	names = ['H_14dayavg', 'AB_lifeavg', 'batting_avg_ytdavg', 'H_30daysum', 'games_30daycount']
+	out = engineer.calc_features(names)
+	rolling = engineer.calc_rolling_avg()
+	calendar = engineer.calc_calendar_avgs(windows=[30])
+	expected = reference(engineer.avg_df)
+
+	assert list(out.columns) == ['roto_game_id', 'roto_game_key'] + names
+	pd.testing.assert_series_equal(out['H_14dayavg'], rolling['H_14dayavg'])
+	pd.testing.assert_series_equal(out['H_30daysum'], calendar['H_30daysum'])
+	pd.testing.assert_series_equal(out['games_30daycount'], calendar['games_30daycount'], check_dtype=False)
+	for name in ['AB_lifeavg', 'batting_avg_ytdavg']:
+		pd.testing.assert_series_equal(out[name], expected.loc[out.index, name], check_names=False)
+
+def test_online_state_equals_batch(engineer):
+	df = engineer.avg_df
+	expected = reference(df)
+	cutoff = '2016-07-01'
+
+	state = OnlineFeatureState.from_history(df[df['game_date'] < cutoff], COLS, WINDOWS)
+	later = df[df['game_date'] >= cutoff].sort_values(['game_date', 'player'])
+
+	days = []
+	for day, slate in later.groupby('game_date', sort=True):
+		#scoring a slate doesn't change the state, and gives what advance then returns for it
+		preview = state.features(slate)
+		advanced = state.advance(slate)
+		pd.testing.assert_frame_equal(preview, advanced)
+		days.append(advanced)
+
+	online = pd.concat(days)
+	assert list(online.columns) == state.feature_names()
+	pd.testing.assert_frame_equal(online, expected.loc[online.index, state.feature_names()])